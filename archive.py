@@ -0,0 +1,294 @@
+import io
+import os
+import json
+import mmap
+import atexit
+import shutil
+import struct
+import tarfile
+import tempfile
+import threading
+import zipfile
+
+# Backups can be read from zip and tar archives without extracting them.
+# Paths into an archive are written like directory paths, e.g.
+# backup.zip/point/<notebook>/<page>/<file>, so the rest of the code can keep
+# joining paths as usual and calls the functions of this module instead of
+# os.path/open where a path might point into an archive.
+# Snapshots in a content-addressed store (see store.py) are read the same
+# way, through the path of their manifest: <store>/snapshots/<name>.snapshot/...
+
+archives = {}
+
+snapshot_suffix = ".snapshot"
+
+def object_path(store_dir, digest):
+    """Path of the object with the given sha256 hex digest in a store."""
+    return os.path.join(store_dir, "objects", digest[:2], digest[2:])
+
+def member_dirs(names):
+    """{directory: set of entries} of a list of member names."""
+    dirs = {"": set()}
+    for name in names:
+        parts = name.split("/")
+        for i in range(len(parts)):
+            dirs.setdefault("/".join(parts[:i]), set()).add(parts[i])
+    return dirs
+
+class MemberFile(io.RawIOBase):
+    """Seekable read-only file over the bytes of an archive member."""
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += len(self.data)
+        self.pos = max(0, offset)
+        return self.pos
+
+    def readinto(self, buffer):
+        chunk = self.data[self.pos:self.pos + len(buffer)]
+        buffer[:len(chunk)] = chunk
+        self.pos += len(chunk)
+        return len(chunk)
+
+    def close(self):
+        if not self.closed:
+            self.data.release()
+        super().close()
+
+class Archive:
+    """Zip or tar archive of a backup.
+
+    Members that are stored uncompressed (zip stored members, plain tar) are
+    handed out as slices of a memory map of the archive, compressed members
+    are decompressed on access. The backup root is the directory of the
+    ShapeDatabase.db member, so archives of the backup folder itself work too.
+    SQLite needs real files, databases are spooled to a temporary directory
+    the first time they are opened.
+
+    An archive is only used by the process that opened it, a forked child
+    (export workers) opens its own file and reuses the spooled files of the
+    parent, which also removes them.
+    """
+
+    def __init__(self, path, parent=None):
+        self.path = path
+        self.pid = os.getpid()
+        self.file = open(path, mode='rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.lock = threading.Lock()
+        self.spool_dir = parent.spool_dir if parent is not None else None
+        self.spooled = dict(parent.spooled) if parent is not None else {}
+        self.owns_spool_dir = False
+        self.zip = None
+        self.tar = None
+        self.compressed = False
+        if zipfile.is_zipfile(path):
+            self.zip = zipfile.ZipFile(self.file)
+            infos = [(info.filename, info) for info in self.zip.infolist() if not info.is_dir()]
+        else:
+            try:
+                self.tar = tarfile.open(path, mode='r:')
+            except tarfile.ReadError:
+                self.tar = tarfile.open(path, mode='r:*')
+                self.compressed = True
+            infos = [(info.name, info) for info in self.tar.getmembers() if info.isfile()]
+        roots = sorted((name.rsplit("/", 1)[0] if "/" in name else "" for (name, info) in infos
+                        if name.rsplit("/", 1)[-1] == "ShapeDatabase.db"), key=len)
+        root = roots[0] + "/" if len(roots) > 0 and roots[0] != "" else ""
+        self.members = {name[len(root):]: info for (name, info) in infos if name.startswith(root)}
+        self.dirs = member_dirs(self.members)
+
+    def member(self, name):
+        if name not in self.members:
+            raise FileNotFoundError(f"{name} not found in {self.path}")
+        return self.members[name]
+
+    def isdir(self, name):
+        return name in self.dirs
+
+    def listdir(self, name):
+        return sorted(self.dirs[name])
+
+    def getsize(self, name):
+        info = self.member(name)
+        return info.file_size if self.zip is not None else info.size
+
+    def read(self, name):
+        """Returns the data of a member as memoryview, zero-copy if it is stored uncompressed."""
+        info = self.member(name)
+        if self.zip is not None:
+            if info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1:
+                # the data follows the local header, whose name/extra fields can differ from the central directory
+                name_length, extra_length = struct.unpack_from("<HH", self.map, info.header_offset + 26)
+                start = info.header_offset + 30 + name_length + extra_length
+                return memoryview(self.map)[start:start + info.file_size]
+            return memoryview(self.zip.read(info))
+        if not self.compressed:
+            return memoryview(self.map)[info.offset_data:info.offset_data + info.size]
+        with self.lock:
+            return memoryview(self.tar.extractfile(info).read())
+
+    def spool(self, name):
+        """Path of a temporary copy of a member, written on first use."""
+        with self.lock:
+            if name not in self.spooled:
+                info = self.member(name)
+                if self.spool_dir is None:
+                    self.spool_dir = tempfile.mkdtemp(prefix="boox-archive-")
+                    self.owns_spool_dir = True
+                path = os.path.join(self.spool_dir, name.replace("/", "_"))
+                # the spool directory can be shared with forked workers, write under a private name first
+                fd, tmp = tempfile.mkstemp(dir=self.spool_dir, suffix=".tmp")
+                with os.fdopen(fd, 'wb') as f:
+                    if self.zip is not None:
+                        with self.zip.open(info) as member:
+                            shutil.copyfileobj(member, f)
+                    elif not self.compressed:
+                        f.write(self.map[info.offset_data:info.offset_data + info.size])
+                    else:
+                        shutil.copyfileobj(self.tar.extractfile(info), f)
+                os.replace(tmp, path)
+                self.spooled[name] = path
+            return self.spooled[name]
+
+    def close(self):
+        if self.zip is not None:
+            self.zip.close()
+        if self.tar is not None:
+            self.tar.close()
+        self.map.close()
+        self.file.close()
+        if self.spool_dir is not None and self.owns_spool_dir and self.pid == os.getpid():
+            shutil.rmtree(self.spool_dir, ignore_errors=True)
+        self.spool_dir = None
+
+class Snapshot:
+    """Backup snapshot in a content-addressed store, see store.py.
+
+    The manifest maps every file of the backup to the sha256 of its
+    contents, the contents are stored once under objects/ and shared by all
+    snapshots. Objects are plain files, so members are memory mapped and
+    databases are opened in place without spooling.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.store_dir = os.path.dirname(os.path.dirname(os.path.abspath(path)))
+        with open(path) as f:
+            self.members = json.load(f)['files']
+        self.dirs = member_dirs(self.members)
+
+    def member(self, name):
+        if name not in self.members:
+            raise FileNotFoundError(f"{name} not found in {self.path}")
+        return self.members[name]
+
+    def isdir(self, name):
+        return name in self.dirs
+
+    def listdir(self, name):
+        return sorted(self.dirs[name])
+
+    def getsize(self, name):
+        return self.member(name)['size']
+
+    def read(self, name):
+        """Returns the data of a member as memoryview of the mapped object."""
+        if self.getsize(name) == 0:
+            return memoryview(b"")
+        with open(self.spool(name), mode='rb') as f:
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def spool(self, name):
+        """Path of the stored object, databases are opened in place (immutable, see decode.connect_readonly)."""
+        return object_path(self.store_dir, self.member(name)['sha256'])
+
+    def close(self):
+        pass
+
+def is_snapshot(path):
+    return path.endswith(snapshot_suffix) and os.path.isfile(path)
+
+def is_archive(path):
+    return os.path.abspath(path) in archives or is_snapshot(path) or \
+        (os.path.isfile(path) and (zipfile.is_zipfile(path) or tarfile.is_tarfile(path)))
+
+def open_archive(path):
+    """Returns the archive (or store snapshot) at path, opened once per process."""
+    path = os.path.abspath(path)
+    archive = archives.get(path)
+    if archive is None:
+        archives[path] = Snapshot(path) if is_snapshot(path) else Archive(path)
+    elif isinstance(archive, Archive) and archive.pid != os.getpid():
+        # inherited from the parent by fork, zip and tar reads seek on the shared file offset
+        archives[path] = Archive(path, archive)
+    return archives[path]
+
+def resolve(path):
+    """Splits a path into (archive, member name), (None, path) if it does not point into an archive."""
+    if os.path.exists(path):
+        return None, path
+    parent = path
+    while not os.path.exists(parent):
+        head = os.path.dirname(parent)
+        if head == parent:
+            return None, path
+        parent = head
+    if not os.path.isfile(parent) or not is_archive(parent):
+        return None, path
+    return open_archive(parent), os.path.relpath(path, parent).replace(os.sep, "/")
+
+def isdir(path):
+    if os.path.isdir(path):
+        return True
+    archive, name = resolve(path)
+    return archive is not None and archive.isdir(name)
+
+def listdir(path):
+    archive, name = resolve(path)
+    return os.listdir(path) if archive is None else archive.listdir(name)
+
+def stat(path):
+    """(size, mtime_ns) of a file, members get the modification time of the archive."""
+    archive, name = resolve(path)
+    if archive is None:
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+    return archive.getsize(name), os.stat(archive.path).st_mtime_ns
+
+def getsize(path):
+    return stat(path)[0]
+
+def open_file(path):
+    """Opens a file for binary reading, archive members are opened in place."""
+    archive, name = resolve(path)
+    if archive is None:
+        return open(path, mode='rb')
+    return io.BufferedReader(MemberFile(archive.read(name)))
+
+def local_path(path):
+    """Path of a file on disk, archive members are spooled to a temporary file."""
+    archive, name = resolve(path)
+    return path if archive is None else archive.spool(name)
+
+def close_all():
+    for archive in archives.values():
+        archive.close()
+    archives.clear()
+
+atexit.register(close_all)
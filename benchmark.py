@@ -0,0 +1,142 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+from tabulate import tabulate
+import decode
+from search import HwrIndex
+from synthetic import generate_backup
+
+def measure(name, function, repeat):
+    """Runs function repeat times, returns the best and mean wall time."""
+    times = []
+    result = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return {"stage": name, "best": min(times), "mean": sum(times) / len(times), "runs": repeat}, result
+
+# modules the list command must not load, they belong to render/search/show
+heavy_modules = ("skia", "IPython")
+
+def measure_startup(dir, repeat):
+    """Times `cli.py list` in a fresh interpreter, returns the timing and the heavy modules it imported."""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli.py")
+    command = [sys.executable, script, "list", "--directory", dir]
+    result, _ = measure("startup: list", lambda: subprocess.run(command, check=True, stdout=subprocess.DEVNULL), repeat)
+    # -X importtime lists every imported module on stderr: "import time: self | cumulative | name"
+    importtime = subprocess.run([sys.executable, "-X", "importtime"] + command[1:], check=True, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE, text=True).stderr
+    modules = set(line.split("|")[-1].strip() for line in importtime.splitlines() if line.startswith("import time:"))
+    return result, sorted(name for name in modules if name.split(".")[0] in heavy_modules)
+
+def page_files(catalog):
+    pages = []
+    for notebook in catalog.notebooks:
+        for page in notebook.pages:
+            if len(page.points) > 0:
+                pages.append([os.path.join(page.point_dir, point) for point in page.points])
+    return pages
+
+def run_benchmarks(dir, repeat=3, render_pages=5):
+    results = []
+    catalog = decode.Catalog(dir)
+    files = [file for page in page_files(catalog) for file in page]
+    point_count = 0
+    for file in files:
+        with decode.PointFile(file) as point_file:
+            point_count += sum(shape['count'] for shape in point_file.shapes)
+
+    result, _ = measure("catalog (lazy)", lambda: [len(notebook.pages) for notebook in decode.Catalog(dir).notebooks], repeat)
+    results.append(result)
+    result, _ = measure("read_db (all shapes and hwr)", lambda: decode.read_db(dir), repeat)
+    results.append(result)
+
+    def decode_all():
+        for file in files:
+            with decode.PointFile(file) as point_file:
+                point_file.read_shapes()
+    result, _ = measure(f"decode points ({point_count} points)", decode_all, repeat)
+    results.append(result)
+
+    def decode_lists():
+        for file in files:
+            decode.read_points_file(file, decode.get_file_info(file, False), False)
+    result, _ = measure("decode points (list output)", decode_lists, repeat)
+    results.append(result)
+
+    pages = [(notebook, page) for notebook in catalog.notebooks for page in notebook.pages if len(page.points) > 0][:render_pages]
+    def render():
+        for notebook, page in pages:
+            files = [os.path.join(page.point_dir, point) for point in page.points]
+            image, found_count = decode.render_page(files, page.info, page.shapes, page.hwr, [], False)
+    result, _ = measure(f"render ({len(pages)} pages)", render, repeat)
+    results.append(result)
+
+    def encode():
+        for notebook, page in pages[:1]:
+            files = [os.path.join(page.point_dir, point) for point in page.points]
+            image, found_count = decode.render_page(files, page.info, page.shapes, page.hwr, [], False)
+            image.encodeToData()
+    result, _ = measure("render + png encode (1 page)", encode, repeat)
+    results.append(result)
+
+    result, index = measure("build search index", lambda: HwrIndex().build(decode.Catalog(dir)), repeat)
+    results.append(result)
+    result, _ = measure("search (100 queries)", lambda: [index.search(term, prefix=True) for term in ["serv", "note", "x"] * 33 + ["idea"]], repeat)
+    results.append(result)
+    catalog.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Time catalog loading, point decoding, rendering and search.')
+    parser.add_argument('--directory', dest='dir',
+                        help='Backup to benchmark, a synthetic backup is generated if not given')
+    parser.add_argument('--notebooks', dest='notebooks', type=int, default=2,
+                        help='Notebooks of the synthetic backup (default: 2)')
+    parser.add_argument('--pages', dest='pages', type=int, default=10,
+                        help='Pages per notebook of the synthetic backup (default: 10)')
+    parser.add_argument('--strokes', dest='strokes', type=int, default=500,
+                        help='Strokes per page of the synthetic backup (default: 500)')
+    parser.add_argument('--points', dest='points', type=int, default=100,
+                        help='Points per stroke of the synthetic backup (default: 100)')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=3,
+                        help='Runs per stage, the best and mean time are reported (default: 3)')
+    parser.add_argument('--startup-budget', dest='startup_budget', type=float, default=500,
+                        help='Maximum best wall time of `cli.py list` in ms, exits with 1 if exceeded (default: 500)')
+    parser.add_argument('--json', dest='json',
+                        help='Also write the results as json to this file')
+    args = parser.parse_args()
+
+    dir = args.dir
+    if dir is None:
+        dir = tempfile.mkdtemp(prefix="boox-benchmark-")
+        print(f"Generating synthetic backup in {dir}", file=sys.stderr)
+        generate_backup(dir, args.notebooks, args.pages, args.strokes, args.points)
+    try:
+        startup, heavy = measure_startup(dir, args.repeat)
+        results = [startup] + run_benchmarks(dir, args.repeat)
+    finally:
+        if args.dir is None:
+            shutil.rmtree(dir)
+
+    table_data = [(r['stage'], f"{r['best'] * 1000:.1f}", f"{r['mean'] * 1000:.1f}") for r in results]
+    print(tabulate(table_data, headers=['Stage', 'Best (ms)', 'Mean (ms)'], tablefmt="plain", stralign="left", numalign="right"))
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1)
+
+    over_budget = startup['best'] * 1000 > args.startup_budget
+    print(f"list startup {startup['best'] * 1000:.1f} ms, budget {args.startup_budget:.0f} ms{' EXCEEDED' if over_budget else ''}")
+    if len(heavy) > 0:
+        print(f"list imported {', '.join(heavy)}")
+    if over_budget or len(heavy) > 0:
+        exit(1)
+
+if __name__ == "__main__":
+    main()
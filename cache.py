@@ -0,0 +1,112 @@
+import os
+import json
+import hashlib
+import tempfile
+import zipfile
+import threading
+import numpy as np
+import archive
+
+def file_signature(paths):
+    """Returns the (path, size, mtime) signature of the given files (or archive members) as bytes."""
+    signature = []
+    for path in paths:
+        size, mtime = archive.stat(path)
+        signature.append([path, size, mtime])
+    return json.dumps(signature).encode('utf-8')
+
+class ParseCache:
+    """On-disk cache for parsed catalogs and decoded point files.
+
+    Every entry is a .npz file named after the kind and source path. The
+    signature of the source files is stored with the entry, so entries whose
+    source changed are dropped on load. The directory is kept below max_size
+    by evicting the least recently used entries.
+
+    One instance can be shared by threads, and several processes can use
+    the same directory: entries removed by someone else are treated as
+    missing.
+    """
+
+    def __init__(self, dir, max_size=512*1024*1024):
+        self.dir = dir
+        self.max_size = max_size
+        self.lock = threading.RLock()
+        os.makedirs(dir, exist_ok=True)
+        self.size = sum(size for (entry, size, mtime) in self.entries())
+
+    def entries(self):
+        """(path, size, mtime) of all entries, skipping those removed while scanning."""
+        entries = []
+        for entry in os.scandir(self.dir):
+            if not entry.name.endswith(".npz"):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((entry.path, st.st_size, st.st_mtime_ns))
+        return entries
+
+    def entry_path(self, kind, path):
+        name = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+        return os.path.join(self.dir, f"{kind}-{name}.npz")
+
+    def load(self, kind, path, signature):
+        """Returns the stored arrays as dict, or None if missing or stale."""
+        entry = self.entry_path(kind, path)
+        try:
+            with np.load(entry, allow_pickle=False) as data:
+                if data['signature'].tobytes() != signature:
+                    arrays = None
+                else:
+                    arrays = {key: data[key] for key in data.files if key != 'signature'}
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            arrays = None
+        if arrays is None:
+            self.remove(entry)
+            return None
+        try:
+            os.utime(entry) # mark as recently used
+        except FileNotFoundError:
+            pass
+        return arrays
+
+    def store(self, kind, path, signature, arrays, compress=False):
+        entry = self.entry_path(kind, path)
+        fd, tmp = tempfile.mkstemp(dir=self.dir, suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            save = np.savez_compressed if compress else np.savez
+            save(f, signature=np.frombuffer(signature, dtype=np.uint8), **arrays)
+        with self.lock:
+            self.remove(entry)
+            size = os.path.getsize(tmp)
+            os.replace(tmp, entry)
+            self.size += size
+            if self.size > self.max_size:
+                self.evict()
+
+    def remove(self, entry):
+        try:
+            size = os.path.getsize(entry)
+            os.remove(entry)
+        except FileNotFoundError:
+            return
+        with self.lock:
+            self.size -= size
+
+    def evict(self):
+        """Removes the least recently used entries until the directory fits max_size, needs self.lock."""
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        self.size = sum(size for (entry, size, mtime) in entries)
+        for entry, size, mtime in entries:
+            if self.size <= self.max_size:
+                break
+            self.remove(entry)
+
+    def clear(self):
+        with self.lock:
+            for entry, size, mtime in self.entries():
+                self.remove(entry)
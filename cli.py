@@ -0,0 +1,93 @@
+import argparse
+import decode
+
+# Subcommand front end of decode.py. Only decode (NumPy and sqlite) is loaded
+# up front, skia, tabulate and IPython are imported by the code path of the
+# subcommand that needs them, so `list` starts without the rendering backends.
+
+def add_common_arguments(parser):
+    parser.add_argument('--directory', dest='dir', required=True,
+                        help='Directory (or zip/tar archive) of the Boox Notes backup')
+    parser.add_argument('--cache', dest='cache',
+                        help='Directory for caching parsed databases and point files between runs')
+    parser.add_argument('--cache-size', dest='cache_size', type=int, default=512,
+                        help='Maximum size of the cache directory in MB (default: 512)')
+    parser.add_argument('--profile', dest='profile',
+                        help='Write wall/cpu time per stage and read/decode/draw counters as json to this file')
+
+def add_io_arguments(parser):
+    parser.add_argument('--io-threads', dest='io_threads', type=int, default=4,
+                        help='Threads reading point files concurrently, 0 reads them one after another (default: 4)')
+    parser.add_argument('--io-buffer', dest='io_buffer', type=int, default=64,
+                        help='Maximum MB of point file data read ahead by --io-threads (default: 64)')
+
+def make_parser():
+    parser = argparse.ArgumentParser(description='Parse a Boox Notes backup and list/render/search/export pages.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('list', help='List the notebooks of the backup')
+    add_common_arguments(command)
+
+    command = commands.add_parser('render', help='Render a page as png, svg, pdf, tiles or thumbnail')
+    add_common_arguments(command)
+    add_io_arguments(command)
+    command.add_argument('--notebook', dest='notebook', required=True,
+                         help='Notebook name')
+    command.add_argument('--page', dest='page', type=int, required=True,
+                         help='Notebook page')
+    command.add_argument('--output', dest='output',
+                         help='Save page to this file')
+    command.add_argument('--format', dest='format', choices=['png', 'svg', 'pdf'], default='png',
+                         help='Output format (default: png)')
+    command.add_argument('--show', dest='show', action='store_true',
+                         help='show result (needs Jupyter/iPython)')
+    command.add_argument('--find', dest="words", nargs='*', default=[],
+                         help='find words on page')
+    command.add_argument('--crop', dest='crop', type=decode.parse_rect,
+                         help='Only render this area of the page: left,top,right,bottom')
+    command.add_argument('--zoom', dest='zoom', type=float, default=1,
+                         help='Scale factor of the rendered page (default: 1)')
+    command.add_argument('--simplify', dest='tolerance', type=float, default=0,
+                         help='Simplify strokes of svg/pdf output, maximum deviation in page pixels (e.g. 0.5)')
+    command.add_argument('--thumbnail', dest='thumbnail', type=int,
+                         help='Save a thumbnail of at most this many pixels wide/high as --output')
+    command.add_argument('--tiles', dest='tiles',
+                         help='Write the page as pyramid of 256x256 png tiles into this directory')
+
+    command = commands.add_parser('search', help='Search words in all notebooks of the backup')
+    add_common_arguments(command)
+    command.add_argument('search', nargs='+', metavar='word',
+                         help='Words to search')
+    command.add_argument('--prefix', dest='prefix', action='store_true',
+                         help='Match search words as prefixes')
+    command.add_argument('--limit', dest='limit', type=int, default=50,
+                         help='Maximum number of search results (default: 50)')
+    command.add_argument('--index', dest='index',
+                         help='Search index file (default: hwr_index.json.gz in the backup directory)')
+
+    command = commands.add_parser('export', help='Render all pages of a notebook or of the whole backup')
+    add_common_arguments(command)
+    add_io_arguments(command)
+    command.add_argument('export', metavar='directory',
+                         help='Output directory')
+    command.add_argument('--notebook', dest='notebook',
+                         help='Only export this notebook')
+    command.add_argument('--format', dest='format', choices=['png', 'svg', 'pdf'], default='png',
+                         help='Output format (default: png), pdf exports one document per notebook')
+    command.add_argument('--simplify', dest='tolerance', type=float, default=0,
+                         help='Simplify strokes of svg/pdf output, maximum deviation in page pixels (e.g. 0.5)')
+    command.add_argument('--incremental', dest='incremental', action='store_true',
+                         help='Only export pages that changed since the last export into the same directory')
+    command.add_argument('--jobs', dest='jobs', type=int, default=None,
+                         help='Number of processes (default: number of CPUs)')
+    return parser
+
+def main(argv=None):
+    parsed = make_parser().parse_args(argv)
+    # the options a subcommand does not have keep the defaults of decode.py, so decode.run dispatches on them as before
+    args = decode.default_args()
+    args.update((key, value) for (key, value) in vars(parsed).items() if value is not None or key not in args)
+    decode.run_profiled(argparse.Namespace(**args))
+
+if __name__ == "__main__":
+    main()
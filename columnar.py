@@ -0,0 +1,118 @@
+import os
+import numpy as np
+from decode import open_catalog, PointFile, PointFileError, point_dtype
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    pyarrow_available = True
+except ImportError:
+    pyarrow_available = False
+
+# Raw point records of a whole backup as a columnar dataset. Coordinates are
+# the untransformed values of the point files (apply the shape matrix for
+# page coordinates), status is null for shapes that are only in the point
+# files and no longer in NewShapeModel (erased ink).
+
+def point_schema():
+    return pa.schema([
+        ("notebook_id", pa.string()),
+        ("page_id", pa.string()),
+        ("shape_id", pa.string()),
+        ("point_index", pa.int32()),
+        ("x", pa.float32()),
+        ("y", pa.float32()),
+        ("size", pa.float32()),
+        ("pressure", pa.int32()),
+        ("status", pa.int32()),
+    ])
+
+class PointBatch:
+    """Collects the point records of whole shapes until a row group is full."""
+
+    def __init__(self):
+        self.records = []
+        self.shapes = []
+        self.rows = 0
+
+    def add(self, notebookId, pageId, shapeId, status, records):
+        self.records.append(records)
+        self.shapes.append((notebookId, pageId, shapeId, status))
+        self.rows += len(records)
+
+    def to_batch(self, schema):
+        counts = np.array([len(records) for records in self.records], dtype=np.int64)
+        records = np.concatenate(self.records)
+        starts = np.repeat(np.cumsum(counts) - counts, counts)
+        columns = []
+        for field in range(3):
+            # ids are repeated per point by arrow, parquet dictionary encodes them again in the file
+            values, indices = np.unique(np.array([shape[field] for shape in self.shapes], dtype=str), return_inverse=True)
+            ids = pa.DictionaryArray.from_arrays(pa.array(np.repeat(indices.astype(np.int32), counts)), pa.array(values))
+            columns.append(ids.dictionary_decode())
+        missing = np.array([shape[3] is None for shape in self.shapes])
+        status = np.array([0 if shape[3] is None else shape[3] for shape in self.shapes], dtype=np.int32)
+        columns += [
+            pa.array((np.arange(len(records)) - starts).astype(np.int32)),
+            pa.array(records['x'].astype(np.float32)),
+            pa.array(records['y'].astype(np.float32)),
+            pa.array(records['size'].astype(np.float32)),
+            pa.array(records['pressure'].astype(np.int32)),
+            pa.array(np.repeat(status, counts), mask=np.repeat(missing, counts)),
+        ]
+        return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+def iter_point_shapes(notebooks, name=None):
+    """Yields (notebook id, page id, shape id, status, records) for every shape in the point files."""
+    for notebook in notebooks['notebooks']:
+        if name is not None and notebook['name'] != name:
+            continue
+        if hasattr(notebook, 'load_all'):
+            notebook.load_all()
+        for page in notebook['pages']:
+            status = {str(shape['shapeId']): shape['status'] for shape in page['shapes']}
+            point_dir = os.path.join(notebooks['basedir'], "point", notebook['id'], page['id'])
+            for point in sorted(page['points']):
+                try:
+                    point_file = PointFile(os.path.join(point_dir, point))
+                except PointFileError as e:
+                    print(f"Warning: skipping corrupt point file {os.path.join(point_dir, point)}: {e}")
+                    continue
+                with point_file:
+                    for shapeId in point_file.ids():
+                        # copy, the buffer is only valid while the file is open
+                        records = np.frombuffer(point_file.shape_buffer(shapeId), dtype=point_dtype).copy()
+                        yield notebook['id'], page['id'], shapeId, status.get(shapeId), records
+
+def export_points(dir, output, name=None, row_group_size=1000000, cache=None):
+    """Writes every point of the backup (or notebook name) as Parquet, or Arrow IPC for .arrow/.feather files.
+
+    Shapes are collected until row_group_size points are buffered and then
+    written as one row group, so memory stays bounded by about one row group.
+    Returns the number of points written.
+    """
+    schema = point_schema()
+    arrow = os.path.splitext(output)[1].lower() in (".arrow", ".feather")
+    if arrow:
+        writer = pa.ipc.new_file(output, schema, options=pa.ipc.IpcWriteOptions(compression="zstd"))
+    else:
+        writer = pq.ParquetWriter(output, schema, compression="zstd")
+    rows = 0
+    batch = PointBatch()
+    def flush():
+        if arrow:
+            writer.write_batch(batch.to_batch(schema))
+        else:
+            writer.write_table(pa.Table.from_batches([batch.to_batch(schema)]), row_group_size=batch.rows)
+    try:
+        for shape in iter_point_shapes(open_catalog(dir, cache), name):
+            batch.add(*shape)
+            if batch.rows >= row_group_size:
+                flush()
+                rows += batch.rows
+                batch = PointBatch()
+        if batch.rows > 0:
+            flush()
+            rows += batch.rows
+    finally:
+        writer.close()
+    return rows
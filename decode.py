@@ -1,77 +1,220 @@
 import os
+import math
+import mmap
 import sqlite3
 import json
 import struct
-import skia
-from tabulate import tabulate
+import numpy as np
 import argparse
+from urllib.request import pathname2url
+from cache import ParseCache, file_signature
+from spatial import PageIndex
+from strokes import StrokeStore
+import instrumentation
+import archive
 
-try:
-    from IPython.display import display, Image
-    iPython_available = True
-except:
-    iPython_available = False
+# skia (render.py), tabulate and IPython are imported by the functions that
+# need them, so listing notebooks or importing this module as a library does
+# not pay for loading them.
 
 dirName = "/home/amd/work/reverse/Test4"
 
-def read_shape_db(dir, id, pageId):
-    shapes = []
-    hwr = []
-    db_file = os.path.join(dir, f"{id}.db")
-    con = sqlite3.connect(db_file)
+def connect_readonly(db_file):
+    instrumentation.count("sqlite connections")
+    db_file = archive.local_path(db_file)
+    # backups are never written, immutable keeps SQLite from creating -wal/-shm files next to WAL mode databases
+    con = sqlite3.connect(f"file:{pathname2url(os.path.abspath(db_file))}?mode=ro&immutable=1", uri=True)
     con.isolation_level = None
     con.row_factory = sqlite3.Row
-    cursor = con.execute(f"SELECT * FROM NewShapeModel where pageUniqueId = '{pageId}'")
-    for row in cursor:
-        #print(f"{row['pageUniqueId']} {pageId}")
-        if row['matrixValues'] != None and row['boundingRect'] != None:
-            shapes.append({"shapeId": row['shapeUniqueId'], 
-                       "documentId": row['documentUniqueId'], 
-                       "pageId": row['pageUniqueId'],
-                       "boundingRect": json.loads(row['boundingRect']),
-                       "matrix": json.loads(row['matrixValues']),
-                       "status": row['status']
-                          })
-    cursor = con.execute(f"SELECT * FROM HWRDataModel where pageUniqueId = '{pageId}'")
-    for row in cursor:
-        hwr.append({
-            "result": row['hwrResult'],
+    return con
+
+def shape_from_row(row):
+    return {"shapeId": row['shapeUniqueId'],
+            "documentId": row['documentUniqueId'],
+            "pageId": row['pageUniqueId'],
+            "boundingRect": json.loads(row['boundingRect']),
+            "matrix": json.loads(row['matrixValues']),
+            "status": row['status']
+            }
+
+def hwr_from_row(row):
+    return {"result": row['hwrResult'],
             "candidates": row['candidates'],
             "boundingRect": json.loads(row['boundingRect']),
-        })
-    return shapes, hwr
-        
+            }
+
+shape_query = ("SELECT shapeUniqueId, documentUniqueId, pageUniqueId, boundingRect, matrixValues, status FROM NewShapeModel"
+               " WHERE matrixValues IS NOT NULL AND boundingRect IS NOT NULL")
+hwr_query = "SELECT pageUniqueId, hwrResult, candidates, boundingRect FROM HWRDataModel"
+
+class NotebookDB:
+    """Read-only connection to a notebook database ({id}.db)."""
+
+    def __init__(self, dir, id):
+        self.con = connect_readonly(os.path.join(dir, f"{id}.db"))
+
+    def read_page(self, pageId):
+        with instrumentation.stage("read_shape_db"):
+            instrumentation.count("sqlite queries", 2)
+            shapes = [shape_from_row(row) for row in self.con.execute(shape_query + " AND pageUniqueId = ?", (pageId,))]
+            hwr = [hwr_from_row(row) for row in self.con.execute(hwr_query + " WHERE pageUniqueId = ?", (pageId,))]
+        return shapes, hwr
+
+    def read_all(self):
+        """Reads both tables once and groups the rows by page id: {pageId: (shapes, hwr)}"""
+        pages = {}
+        with instrumentation.stage("read_shape_db"):
+            instrumentation.count("sqlite queries", 2)
+            for row in self.con.execute(shape_query):
+                pages.setdefault(row['pageUniqueId'], ([], []))[0].append(shape_from_row(row))
+            for row in self.con.execute(hwr_query):
+                pages.setdefault(row['pageUniqueId'], ([], []))[1].append(hwr_from_row(row))
+        return pages
+
+    def shape_ids(self):
+        """Ids of the shapes rendering draws (same filter as read_page), grouped by page id: {pageId: {shapeId}}"""
+        pages = {}
+        with instrumentation.stage("read_shape_db"):
+            instrumentation.count("sqlite queries")
+            for row in self.con.execute(shape_query):
+                pages.setdefault(row['pageUniqueId'], set()).add(str(row['shapeUniqueId']))
+        return pages
+
+    def close(self):
+        self.con.close()
+
+def read_shape_db(dir, id, pageId):
+    db = NotebookDB(dir, id)
+    try:
+        return db.read_page(pageId)
+    finally:
+        db.close()
+
+class Page:
+    """Page proxy, shapes, hwr and point files are loaded on first access."""
+
+    def __init__(self, catalog, notebook, pageNr, id, info):
+        self.catalog = catalog
+        self.notebook = notebook
+        self.pageNr = pageNr
+        self.id = id
+        self.info = info
+        self._points = None
+        self._shapes = None
+        self._hwr = None
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    @property
+    def point_dir(self):
+        return os.path.join(self.catalog.basedir, "point", self.notebook.id, self.id)
+
+    @property
+    def points(self):
+        if self._points is None:
+            self._points = archive.listdir(self.point_dir) if archive.isdir(self.point_dir) else []
+        return self._points
+
+    def _load_shapes(self):
+        self._shapes, self._hwr = [], []
+        if archive.isdir(self.point_dir):
+            self._shapes, self._hwr = self.catalog.db(self.notebook.id).read_page(self.id)
+
+    @property
+    def shapes(self):
+        if self._shapes is None:
+            self._load_shapes()
+        return self._shapes
+
+    @property
+    def hwr(self):
+        if self._hwr is None:
+            self._load_shapes()
+        return self._hwr
+
+    def to_dict(self):
+        return {"pageNr": self.pageNr, "id": self.id, "info": self.info, "hwr": self.hwr, "shapes": self.shapes, "points": self.points}
+
+class Notebook:
+    def __init__(self, catalog, name, id, info, pageIds):
+        self.catalog = catalog
+        self.name = name
+        self.id = id
+        self.info = info
+        self.pages = []
+        for pageNr, pageId in enumerate(pageIds, start=1):
+            pageInfo = info['pageInfoMap'].get(pageId, {})
+            self.pages.append(Page(catalog, self, pageNr, pageId, pageInfo))
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def load_all(self):
+        """Loads shapes and hwr of all pages with one query per table."""
+        rows = {}
+        # notebooks without any point directory may have no database at all
+        if any(archive.isdir(page.point_dir) for page in self.pages):
+            rows = self.catalog.db(self.id).read_all()
+        for page in self.pages:
+            page._shapes, page._hwr = [], []
+            if archive.isdir(page.point_dir):
+                page._shapes, page._hwr = rows.get(page.id, ([], []))
+
+    def to_dict(self):
+        self.load_all()
+        return {"name": self.name, "id": self.id, "info": self.info, "pages": [page.to_dict() for page in self.pages]}
+
+class Catalog:
+    """Lazy view of a backup, only NoteModel is read up front.
+
+    Supports the same item access as the read_db dict, so it can be passed
+    to get_page_data/show_page directly.
+    """
+
+    def __init__(self, dir):
+        self.basedir = dir
+        self.notebooks = []
+        self.dbs = {}
+        with instrumentation.stage("read_db"):
+            con = connect_readonly(os.path.join(dir, "ShapeDatabase.db"))
+            instrumentation.count("sqlite queries")
+            cursor = con.execute("SELECT uniqueId, title, pageNameList, notePageInfo FROM NoteModel")
+            for row in cursor:
+                if row['pageNameList'] is None:
+                    print(f"Warning: Missing pageNameList for row with uniqueId: {row['uniqueId']}. Skipping this row.")
+                    continue
+                pageNameList = json.loads(row['pageNameList'])
+                pageInfo = json.loads(row['notePageInfo'])
+                self.notebooks.append(Notebook(self, row['title'], row['uniqueId'], pageInfo, pageNameList['pageNameList']))
+            con.close()
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def db(self, id):
+        """Returns the pooled connection of a notebook database."""
+        if id not in self.dbs:
+            self.dbs[id] = NotebookDB(self.basedir, id)
+        return self.dbs[id]
+
+    def close(self):
+        for db in self.dbs.values():
+            db.close()
+        self.dbs = {}
+
+    def to_dict(self):
+        return {"basedir": self.basedir, "notebooks": [notebook.to_dict() for notebook in self.notebooks]}
+
 def read_db(dir):
-    db_file = os.path.join(dir, "ShapeDatabase.db")
-    con = sqlite3.connect(db_file)
-    con.isolation_level = None
-    con.row_factory = sqlite3.Row
-    cursor = con.execute("SELECT * FROM NoteModel")
-    notebooks = {"basedir": dir, "notebooks": [] }
-    for row in cursor:
-        if row['pageNameList'] is None:
-            print(f"Warning: Missing pageNameList for row with uniqueId: {row['uniqueId']}. Skipping this row.")
-            continue
-        pageNameList = json.loads(row['pageNameList'])
-        pageInfo = json.loads(row['notePageInfo'])
-        notebook = { "name": row['title'], "id": row['uniqueId'], "info": pageInfo, "pages": [] }
-        pageNr = 0
-        for pageId in pageNameList['pageNameList']:
-            pageNr = pageNr + 1
-            points_files = []
-            shapes = []
-            hwr = []
-            info = {}
-            if pageId in pageInfo['pageInfoMap']:
-                info = pageInfo['pageInfoMap'][pageId]
-            point_dir = os.path.join(dir, "point", notebook['id'], pageId)
-            if os.path.isdir(point_dir):
-                points_files = os.listdir(point_dir)
-                shapes, hwr = read_shape_db(dir, notebook['id'], pageId)
-                
-            notebook['pages'].append({"pageNr": pageNr, "id": pageId, "info": info, "hwr": hwr, "shapes": shapes, "points": points_files})
-        notebooks['notebooks'].append(notebook)
-    return notebooks
+    with Catalog(dir) as catalog:
+        return catalog.to_dict()
 
 
 def point(f, dbg):
@@ -84,57 +227,225 @@ def point(f, dbg):
         print(f"x: {x:.2f}, y: {y:.2f}, p: {p:.2f}")
     return (x, y)
 
-def get_file_info(fileName, dbg):
-    size = os.path.getsize(fileName)
+class PointFileError(ValueError):
+    """A point file whose footer or trailer is inconsistent."""
+
+def trailer_range(size, end_block_start):
+    if size < 4 or end_block_start < 0 or end_block_start > size-4 or (size-4-end_block_start) % 44 != 0:
+        raise PointFileError(f"shape count calculation wrong, trailer at {end_block_start} in {size} bytes")
+    return end_block_start, size-4
+
+def check_trailer(shapes, end_block_start):
+    """Raises PointFileError if a trailer record points outside of the point data."""
+    for shape in shapes:
+        if shape['start'] < 0 or shape['length'] < 0 or shape['start'] + shape['length'] > end_block_start:
+            raise PointFileError(f"shape {shape['id'].decode('UTF-8', 'replace')} points {shape['start']}+{shape['length']} outside of point data")
+        if shape['length'] % point_dtype.itemsize != 0:
+            raise PointFileError(f"shape {shape['id'].decode('UTF-8', 'replace')} length {shape['length']} is no multiple of the point size")
+    return shapes
+
+def parse_trailer(trailer, dbg):
+    """Parse the 44 byte trailer records (uuid, start, length) of a point file."""
     shapes = []
-    with open(fileName, mode='rb') as f:
-        f.seek(size-4)
-        end_block_start = struct.unpack(">i", f.read(4))[0]
-        f.seek(end_block_start)
-        shape_count = (size-4-end_block_start)/44
-        if shape_count != int(shape_count):
-            print("ERROR, shape count calculation wrong")
-            exit(1)
+    for (uid, start, length) in struct.iter_unpack(">36sii", trailer):
+        count = int(length/16)
+        shapes.append({"id": uid, "start": start, "length": length, "count": count})
         if dbg:
-            print(f"End block starts at {end_block_start}, number of shapes: {shape_count}")
-            
-        for i in range(int(shape_count)):
+            print(f"shape {uid}: from {start} ({count} shapes)")
+    return shapes
 
-            uid = struct.unpack("36s", f.read(36))[0]
-            start = struct.unpack(">i", f.read(4))[0]
-            length = struct.unpack(">i", f.read(4))[0]
-            count = int(length/16)
-            shapes.append({"id": uid, "start": start, "length": length, "count": count})
+def get_file_info(fileName, dbg):
+    with instrumentation.stage("get_file_info"):
+        size = archive.getsize(fileName)
+        if size < 4:
+            raise PointFileError(f"file too small ({size} bytes)")
+        with archive.open_file(fileName) as f:
+            f.seek(size-4)
+            end_block_start = struct.unpack(">i", f.read(4))[0]
+            start, end = trailer_range(size, end_block_start)
             if dbg:
-                print(f"shape {uid}: from {start} ({count} shapes)")
-    return shapes
-    
-def read_points_file(fileName, shapes, dbg):
-    header_size = 80
+                print(f"End block starts at {end_block_start}, number of shapes: {(end-start)//44}")
+            f.seek(start)
+            instrumentation.count("bytes read", 4 + end - start)
+            return check_trailer(parse_trailer(f.read(end-start), dbg), end_block_start)
+
+# one point record: size, x, y, pressure (all big endian)
+point_dtype = np.dtype([('size', '>f4'), ('x', '>f4'), ('y', '>f4'), ('pressure', '>i4')])
+
+def decode_points(buffer):
+    """Decode a buffer of point records into contiguous (x, y, pressure) arrays."""
+    count = len(buffer) // point_dtype.itemsize
+    instrumentation.count("bytes read", count * point_dtype.itemsize)
+    instrumentation.count("points decoded", count)
+    records = np.frombuffer(buffer, dtype=point_dtype, count=count)
+    x = np.ascontiguousarray(records['x'], dtype=np.float32)
+    y = np.ascontiguousarray(records['y'], dtype=np.float32)
+    pressure = np.ascontiguousarray(records['pressure'], dtype=np.int32)
+    return x, y, pressure
+
+def read_points_arrays(fileName, shapes, dbg):
     points = []
-    with open(fileName, mode='rb') as f: # b is important -> binary
-        version = struct.unpack(">I", f.read(4))[0]
-        uid = struct.unpack("36s", f.read(36))[0]
-        uid = struct.unpack("36s", f.read(36))[0]
-        unknown = struct.unpack(">f", f.read(4))[0]
+    with instrumentation.stage("read_points_file"), archive.open_file(fileName) as f: # b is important -> binary
         if dbg:
+            version = struct.unpack(">I", f.read(4))[0]
+            uid = struct.unpack("36s", f.read(36))[0]
             print(f"version: {version}")
             print(f"uid: {uid}")
-            print(f"uid: {uid}")
         for shape in shapes:
-            current_points = ([], [], shape['id'].decode('UTF-8'))
             f.seek(shape['start'])
             if dbg:
                 print(f"drawing shape {shape['id']} with {shape['count']} strokes")
-            for i in range(shape['count']):
+            x, y, pressure = decode_points(f.read(shape['count'] * point_dtype.itemsize))
+            points.append((x, y, pressure, shape['id'].decode('UTF-8')))
+    return points
+
+def read_points_file(fileName, shapes, dbg):
+    # list based output, kept for compatibility
+    return [(x.tolist(), y.tolist(), id) for (x, y, pressure, id) in read_points_arrays(fileName, shapes, dbg)]
+
+class PointFile:
+    """Memory mapped point file.
+
+    The trailer is parsed once when the file is opened, point data is handed
+    out as zero-copy memoryviews and only decoded for the shapes asked for.
+    The views are only valid until the file is closed.
+    """
+
+    def __init__(self, fileName, dbg=False, data=None):
+        self.fileName = fileName
+        self.dbg = dbg
+        backup, member = archive.resolve(fileName) if data is None else (None, None)
+        if data is not None:
+            # contents already read by the caller (see prefetch.py)
+            self.file = self.map = None
+            self.data = memoryview(data)
+        elif backup is None:
+            if os.path.getsize(fileName) == 0:
+                raise PointFileError("file too small (0 bytes)")
+            self.file = open(fileName, mode='rb')
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.data = memoryview(self.map)
+        else:
+            # archive members are slices of the mapped archive (or decompressed bytes)
+            self.file = self.map = None
+            self.data = backup.read(member)
+        try:
+            with instrumentation.stage("get_file_info"):
+                size = len(self.data)
+                if size < 4:
+                    raise PointFileError(f"file too small ({size} bytes)")
+                end_block_start = struct.unpack_from(">i", self.data, size-4)[0]
+                start, end = trailer_range(size, end_block_start)
                 if dbg:
-                    print(f"{i:02x}", end =", ")
-                (x,y) = point(f, dbg)
-                current_points[0].append(x)
-                current_points[1].append(y)
-            points.append(current_points)
+                    print(f"End block starts at {end_block_start}, number of shapes: {(end-start)//44}")
+                instrumentation.count("bytes read", 4 + end - start)
+                self.shapes = check_trailer(parse_trailer(self.data[start:end], dbg), end_block_start)
+            self.index = {shape['id'].decode('UTF-8'): shape for shape in self.shapes}
+        except (PointFileError, UnicodeDecodeError) as e:
+            self.close()
+            raise e if isinstance(e, PointFileError) else PointFileError("shape id is no valid UTF-8")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, id):
+        return id in self.index
+
+    def ids(self):
+        return self.index.keys()
+
+    def shape_buffer(self, id):
+        """Returns the raw point records of a shape as memoryview."""
+        shape = self.index[id]
+        return self.data[shape['start']:shape['start'] + shape['count'] * point_dtype.itemsize]
+
+    def read_shapes(self, ids=None):
+        """Decode the given shape ids (all if None) in file order, unknown ids are ignored."""
+        points = []
+        with instrumentation.stage("read_points_file"):
+            for shape in self.shapes:
+                id = shape['id'].decode('UTF-8')
+                if ids is not None and id not in ids:
+                    instrumentation.count("shapes skipped")
+                    continue
+                if self.dbg:
+                    print(f"drawing shape {shape['id']} with {shape['count']} strokes")
+                x, y, pressure = decode_points(self.shape_buffer(id))
+                points.append((x, y, pressure, id))
+        return points
+
+    def close(self):
+        if self.data is not None:
+            self.data.release()
+            if self.map is not None:
+                self.map.close()
+                self.file.close()
+            self.data = self.map = None
+
+def catalog_signature(dir):
+    """Signature of everything read_db looks at: the databases and the point directories."""
+    if archive.is_archive(dir):
+        return file_signature([dir])
+    paths = sorted(entry.path for entry in os.scandir(dir) if entry.name.endswith(".db"))
+    point_dir = os.path.join(dir, "point")
+    if os.path.isdir(point_dir):
+        for notebook_dir in sorted(entry.path for entry in os.scandir(point_dir) if entry.is_dir()):
+            paths.append(notebook_dir)
+            paths.extend(sorted(entry.path for entry in os.scandir(notebook_dir) if entry.is_dir()))
+    return file_signature(paths)
+
+def read_db_cached(dir, cache):
+    signature = catalog_signature(dir)
+    arrays = cache.load("catalog", dir, signature)
+    if arrays is not None:
+        return json.loads(arrays['catalog'].tobytes())
+    notebooks = read_db(dir)
+    data = np.frombuffer(json.dumps(notebooks).encode('utf-8'), dtype=np.uint8)
+    cache.store("catalog", dir, signature, {"catalog": data}, compress=True)
+    return notebooks
+
+def pack_points(points):
+    """Packs a list of (x, y, pressure, id) into flat arrays with offsets per shape."""
+    offsets = np.zeros(len(points) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(x) for (x, y, pressure, id) in points])
+    return {
+        "x": np.concatenate([x for (x, y, pressure, id) in points] or [np.empty(0, np.float32)]),
+        "y": np.concatenate([y for (x, y, pressure, id) in points] or [np.empty(0, np.float32)]),
+        "pressure": np.concatenate([pressure for (x, y, pressure, id) in points] or [np.empty(0, np.int32)]),
+        "offsets": offsets,
+        "ids": np.array([id.encode('UTF-8') for (x, y, pressure, id) in points], dtype="S36"),
+    }
+
+def unpack_points(arrays):
+    offsets = arrays['offsets']
+    points = []
+    for i, id in enumerate(arrays['ids']):
+        start, end = offsets[i], offsets[i+1]
+        points.append((arrays['x'][start:end], arrays['y'][start:end], arrays['pressure'][start:end], id.decode('UTF-8')))
+    return points
+
+def read_points_cached(fileName, cache, dbg):
+    """Decoded points of all shapes in a point file, served from the cache if unchanged."""
+    signature = file_signature([fileName])
+    arrays = cache.load("points", fileName, signature)
+    if arrays is not None:
+        instrumentation.count("cache hits")
+        return unpack_points(arrays)
+    instrumentation.count("cache misses")
+    with PointFile(fileName, dbg) as point_file:
+        points = point_file.read_shapes()
+    cache.store("points", fileName, signature, pack_points(points))
     return points
 
+def open_catalog(dir, cache=None):
+    """Lazy Catalog, or the full read_db result from the cache if one is given."""
+    if cache is not None:
+        return read_db_cached(dir, cache)
+    return Catalog(dir)
+
 def get_page_data(notebooks, name, pageNr):
     point_files = []
     info = {}
@@ -156,16 +467,62 @@ def get_page_data(notebooks, name, pageNr):
                         point_files.append(file_path)
     return point_files, info, shapes, hwr
 
-def show_page(notebooks, name, page, words, output, show, dbg):
+def load_strokes(files, shapes, dbg, cache=None, prefetcher=None):
+    """Decodes the strokes of the given shapes from the point files of a page into a StrokeStore.
+
+    With a prefetch.Prefetcher the files are read and decoded concurrently.
+    """
+    shapes = {str(shape['shapeId']): shape for shape in shapes}
+    points = []
+    if prefetcher is not None:
+        # files arrive in any order, keep file order so the result does not depend on timing
+        results = [[] for file in files]
+        for i, file_points in prefetcher.points(files, shapes):
+            results[i] = file_points
+        files = []
+        points = [p for file_points in results for p in file_points]
+    for file in files:
+        try:
+            if cache is not None:
+                points.extend(p for p in read_points_cached(file, cache, dbg) if p[3] in shapes)
+            else:
+                with PointFile(file, dbg) as point_file:
+                    # only decode shapes that are still present in the db
+                    points.extend(point_file.read_shapes(shapes))
+        except PointFileError as e:
+            print(f"Warning: skipping corrupt point file {file}: {e}")
+    # invalid/deleted shapes in db are not printed (they might be in the points file though, so beware!)
+    with instrumentation.stage("transform"):
+        return StrokeStore.from_points(points, shapes)
+
+def render_page(files, info, shapes, hwr, words, dbg, cache=None, crop=None, zoom=1, strokes=None, prefetcher=None):
+    """Renders the point files of a page, returns the image and the number of found words.
+
+    crop is an optional (left, top, right, bottom) page rectangle, only the
+    strokes intersecting it are decoded and drawn. zoom scales the output.
+    strokes is the already decoded StrokeStore of the page, if the caller
+    keeps one around the point files are not read again.
+    """
+    import skia
+    from render import draw_strokes, stroke_width
     found_count = 0
-    files, info, shapes, hwr =  get_page_data(notebooks, name, page)
+    if crop is None:
+        crop = (0, 0, info['width'], info['height'])
+    elif strokes is None:
+        # only keep the shapes whose bounding rect intersects the cropped area
+        shapes = PageIndex(shapes, []).shapes_in(*crop, margin=stroke_width)
+    else:
+        b = strokes.bounds
+        strokes = strokes.select(np.nonzero((b[:, 0] <= crop[2] + stroke_width) & (b[:, 2] >= crop[0] - stroke_width) &
+                                            (b[:, 1] <= crop[3] + stroke_width) & (b[:, 3] >= crop[1] - stroke_width))[0])
+    width = max(1, math.ceil((crop[2] - crop[0]) * zoom))
+    height = max(1, math.ceil((crop[3] - crop[1]) * zoom))
     if dbg:
-        print(f"canvas size: {info['width']}x{info['height']}")
-    surface = skia.Surface(info['width'], info['height'])
+        print(f"canvas size: {width}x{height}")
+    surface = skia.Surface(width, height)
     canvas = surface.getCanvas()
-    
-    paint = skia.Paint()
-    paint.setAntiAlias(True)
+    canvas.scale(zoom, zoom)
+    canvas.translate(-crop[0], -crop[1])
     
     found_paint = skia.Paint(
         AntiAlias=True,
@@ -174,74 +531,208 @@ def show_page(notebooks, name, page, words, output, show, dbg):
         Color=skia.ColorRED,
     )
 
-    shapes = {str(shapes[i]['shapeId']): shapes[i] for i in range(0, len(shapes))}
-    for file in files:
-        points = read_points_file(file, get_file_info(file, dbg), dbg)
-
-        for (x_values, y_values, id) in points:
-            path = skia.Path()
-            paint.setStyle(skia.Paint.kStroke_Style)
-            shape = shapes[id] if id in shapes else None
-            if shape != None: #invalid/deleted shapes in db are not printed (they might be in the points file though, so beware!)
-                for i in range(len(x_values)):
-                    if i == 0:
-                        path.moveTo(x_values[i], y_values[i])
-                    else:
-                        path.lineTo(x_values[i], y_values[i])
-                if shape['matrix'] != None and shape['matrix']['values'] != None:
-                    path.transform(skia.Matrix(shape['matrix']['values']))
-
-            canvas.drawPath(path, paint)
-            paint.setColor(skia.ColorBLUE)
-            paint.setStrokeWidth(2)
-            canvas.drawPath(path, paint)
-            
-        for word in words:
-            found_items = filter(lambda x: x['result'].lower() == word, hwr)
-            for found in found_items:
-                found_count = found_count + 1
-                r = found['boundingRect']
-                rect = skia.Rect(r['left'],r['top'],r['right'],r['bottom'])
-                canvas.drawRect(rect, found_paint)
-                        
-    image = surface.makeImageSnapshot()
+    if strokes is None:
+        strokes = load_strokes(files, shapes, dbg, cache, prefetcher)
+    draw_strokes(canvas, strokes)
+
+    words = set(word.lower() for word in words)
+    for found in hwr:
+        if found['result'].lower() in words:
+            found_count = found_count + 1
+            r = found['boundingRect']
+            rect = skia.Rect(r['left'],r['top'],r['right'],r['bottom'])
+            canvas.drawRect(rect, found_paint)
+
+    return surface.makeImageSnapshot(), found_count
+
+def ipython_display(image):
+    """Shows an image in Jupyter/IPython, returns False if IPython is not available."""
+    try:
+        from IPython.display import display, Image
+    except ImportError:
+        return False
+    display(Image(data=image.encodeToData()))
+    return True
+
+def show_page(notebooks, name, page, words, output, show, dbg, cache=None, crop=None, zoom=1, prefetcher=None):
+    files, info, shapes, hwr =  get_page_data(notebooks, name, page)
+    image, found_count = render_page(files, info, shapes, hwr, words, dbg, cache, crop, zoom, prefetcher=prefetcher)
     if output != None:
-        image.save(output, skia.kPNG)
-    if iPython_available and show:
-        display(Image(data=image.encodeToData()))
+        import skia
+        with instrumentation.stage("png encode"):
+            image.save(output, skia.kPNG)
+    if show:
+        ipython_display(image)
     return found_count
 
-parser = argparse.ArgumentParser(description='Parse a Boox Notes backup and search/show/save a page.')
-parser.add_argument('--directory', dest='dir', required=True,
-                    help='Directory of the Boox Notes backup')
-parser.add_argument('--output', dest='output',
-                    help='Save page as png file')
-parser.add_argument('--notebook', dest='notebook',
-                    help='Notebook name')
-parser.add_argument('--page', dest='page', type=int,
-                    help='Notebook page')
-parser.add_argument('--show', dest='show', action='store_true',
-                    help='show result (needs Jupyter/iPython)')
-parser.add_argument('--find', dest="words", nargs='*', help='find words on page', default=[])
-args = parser.parse_args()
-
-if args.notebook is None:
-    notebooks = read_db(args.dir)
+def parse_rect(value):
+    rect = tuple(float(v) for v in value.split(","))
+    if len(rect) != 4 or rect[2] <= rect[0] or rect[3] <= rect[1]:
+        raise argparse.ArgumentTypeError("expected left,top,right,bottom")
+    return rect
+
+def make_parser():
+    parser = argparse.ArgumentParser(description='Parse a Boox Notes backup and search/show/save/export pages.')
+    parser.add_argument('--directory', dest='dir', required=True,
+                        help='Directory of the Boox Notes backup')
+    parser.add_argument('--output', dest='output',
+                        help='Save page as png file')
+    parser.add_argument('--notebook', dest='notebook',
+                        help='Notebook name')
+    parser.add_argument('--page', dest='page', type=int,
+                        help='Notebook page')
+    parser.add_argument('--show', dest='show', action='store_true',
+                        help='show result (needs Jupyter/iPython)')
+    parser.add_argument('--find', dest="words", nargs='*', help='find words on page', default=[])
+    parser.add_argument('--crop', dest='crop', type=parse_rect,
+                        help='Only render this area of the page: left,top,right,bottom')
+    parser.add_argument('--zoom', dest='zoom', type=float, default=1,
+                        help='Scale factor of the rendered page (default: 1)')
+    parser.add_argument('--thumbnail', dest='thumbnail', type=int,
+                        help='Save a thumbnail of at most this many pixels wide/high as --output')
+    parser.add_argument('--tiles', dest='tiles',
+                        help='Write the page as pyramid of 256x256 png tiles into this directory')
+    parser.add_argument('--cache', dest='cache',
+                        help='Directory for caching parsed databases and point files between runs')
+    parser.add_argument('--cache-size', dest='cache_size', type=int, default=512,
+                        help='Maximum size of the cache directory in MB (default: 512)')
+    parser.add_argument('--export', dest='export',
+                        help='Render all pages of --notebook (or of the whole backup) as png files into this directory')
+    parser.add_argument('--format', dest='format', choices=['png', 'svg', 'pdf'], default='png',
+                        help='Output format of --output and --export (default: png), pdf exports one document per notebook')
+    parser.add_argument('--simplify', dest='tolerance', type=float, default=0,
+                        help='Simplify strokes of svg/pdf output, maximum deviation in page pixels (e.g. 0.5)')
+    parser.add_argument('--incremental', dest='incremental', action='store_true',
+                        help='Only export pages that changed since the last --export into the same directory')
+    parser.add_argument('--jobs', dest='jobs', type=int, default=os.cpu_count(),
+                        help='Number of processes used by --export (default: number of CPUs)')
+    parser.add_argument('--io-threads', dest='io_threads', type=int, default=4,
+                        help='Threads reading point files concurrently (also used by --verify), 0 reads them one after another (default: 4)')
+    parser.add_argument('--io-buffer', dest='io_buffer', type=int, default=64,
+                        help='Maximum MB of point file data read ahead by --io-threads (default: 64)')
+    parser.add_argument('--verify', dest='verify', action='store_true',
+                        help='Check the trailers of all point files against the databases, prints a json report')
+    parser.add_argument('--search', dest='search', nargs='+',
+                        help='Search words in all notebooks of the backup')
+    parser.add_argument('--prefix', dest='prefix', action='store_true',
+                        help='Match search words as prefixes')
+    parser.add_argument('--limit', dest='limit', type=int, default=50,
+                        help='Maximum number of search results (default: 50)')
+    parser.add_argument('--index', dest='index',
+                        help='Search index file (default: hwr_index.json.gz in the backup directory)')
+    parser.add_argument('--points', dest='points',
+                        help='Write every point of the backup (or of --notebook) as Parquet file, .arrow/.feather writes Arrow IPC')
+    parser.add_argument('--row-group', dest='row_group', type=int, default=1000000,
+                        help='Points per row group of --points (default: 1000000)')
+    parser.add_argument('--profile', dest='profile',
+                        help='Write wall/cpu time per stage and read/decode/draw counters as json to this file')
+    return parser
+
+def default_args():
+    """Defaults of every option of make_parser, used by cli.py to fill in the options a subcommand has not."""
+    return {action.dest: action.default for action in make_parser()._actions if action.dest != 'help'}
+
+def main():
+    run_profiled(make_parser().parse_args())
+
+def run_profiled(args):
+    if args.profile is None:
+        run(args)
+        return
+    instrumentation.enable()
+    try:
+        run(args)
+    finally:
+        instrumentation.write_report(args.profile)
+
+def list_notebooks(dir, cache):
+    from tabulate import tabulate
+    notebooks = open_catalog(dir, cache)
     table_data = [(notebook['name'], len(notebook['pages'])) for notebook in notebooks['notebooks']]
-    
+
     # Respect the number of columns available in the terminal
-    term_width = os.get_terminal_size().columns
-    
+    try:
+        term_width = os.get_terminal_size().columns
+    except OSError:
+        term_width = 80
+
     # Format and print table
     table = tabulate(table_data, headers=['Notebook', 'Pages'], tablefmt="grid", stralign="left", numalign="right")
     if len(table) > term_width:
         table = tabulate(table_data, headers=['Notebook', 'Pages'], tablefmt="plain", stralign="left", numalign="right")
     print(table)
-else:
-    dbg = False
-    if args.page != None:
-        found_count = show_page(read_db(args.dir), args.notebook, args.page, args.words, args.output, args.show, dbg)
-        if len(args.words) > 0:
-            print(f"Found {found_count} words")
+
+def search_backup(dir, words, prefix, limit, index, cache):
+    from tabulate import tabulate
+    from search import open_index
+    hits = open_index(dir, index, cache).search(" ".join(words), prefix, limit)
+    table_data = [(hit['notebook'], hit['pageNr'], hit['text'], f"{hit['score']:.2f}") for hit in hits]
+    print(tabulate(table_data, headers=['Notebook', 'Page', 'Word', 'Score'], tablefmt="plain", stralign="left", numalign="right"))
+    print(f"Found {len(hits)} words")
+
+def run(args):
+    cache = ParseCache(args.cache, args.cache_size*1024*1024) if args.cache else None
+
+    if args.export is not None:
+        from export import export_backup
+        export_backup(args.dir, args.notebook, args.export, args.jobs, cache, args.format, args.tolerance, args.incremental,
+                      args.io_threads, args.io_buffer*1024*1024)
+    elif args.verify:
+        from verify import verify_backup
+        report = verify_backup(args.dir, max(1, args.io_threads))
+        print(json.dumps(report, indent=1))
+        if len(report['inconsistent']) + len(report['orphaned']) + len(report['missing']) > 0:
+            exit(1)
+    elif args.points is not None:
+        import columnar
+        if not columnar.pyarrow_available:
+            print("--points needs pyarrow, install it with: pip install pyarrow")
+            return
+        count = columnar.export_points(args.dir, args.points, args.notebook, args.row_group, cache)
+        print(f"Wrote {count} points to {args.points}")
+    elif args.search is not None:
+        search_backup(args.dir, args.search, args.prefix, args.limit, args.index, cache)
+    elif args.notebook is None:
+        list_notebooks(args.dir, cache)
     else:
-        print("Missing page, use --page <page>")
+        dbg = False
+        if args.page != None and (args.thumbnail != None or args.tiles != None):
+            import skia
+            from tiles import page_tiles
+            tiles = page_tiles(open_catalog(args.dir, cache), args.notebook, args.page, store_dir=args.tiles, cache=cache)
+            if tiles is None:
+                print(f"No page {args.page} with content in notebook {args.notebook}")
+                return
+            if args.tiles != None:
+                tiles.write_pyramid()
+            if args.thumbnail != None and args.output != None:
+                tiles.thumbnail(args.thumbnail).save(args.output, skia.kPNG)
+        elif args.page != None and args.format != 'png':
+            if args.output == None:
+                print("Missing output file, use --output <file>")
+                return
+            from vector import write_svg, PdfWriter
+            files, info, shapes, hwr = get_page_data(open_catalog(args.dir, cache), args.notebook, args.page)
+            store = load_strokes(files, shapes, dbg, cache).simplify(args.tolerance)
+            if args.format == 'svg':
+                write_svg(args.output, store, info)
+            else:
+                with PdfWriter(args.output) as pdf:
+                    pdf.add_page(store, info)
+        elif args.page != None:
+            prefetcher = None
+            if args.io_threads > 0:
+                from prefetch import Prefetcher
+                prefetcher = Prefetcher(args.io_threads, args.io_buffer*1024*1024, cache, dbg)
+            try:
+                found_count = show_page(open_catalog(args.dir, cache), args.notebook, args.page, args.words, args.output, args.show, dbg, cache, args.crop, args.zoom, prefetcher)
+            finally:
+                if prefetcher is not None:
+                    prefetcher.close()
+            if len(args.words) > 0:
+                print(f"Found {found_count} words")
+        else:
+            print("Missing page, use --page <page>")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
+import os
 import sys
+import mmap
+import json
 import uuid
+import multiprocessing
 import struct
 import pyjson5 
 import re
@@ -46,24 +50,70 @@ def decode_length_manual(byte1, byte2):
     
     return actual_length
 
-def read_until_marker(file, marker):
-    """Reads file content until a specific marker is found. Returns the content up to (but not including) the marker."""
-    content = b''
-    marker_length = len(marker)
-    read_bytes = 0
-    while True:
-        byte = file.read(1)
-        read_bytes = read_bytes + 1
-        if not byte:
-            # End of file reached without finding the marker
-            break
-        content += byte
-        # Check if the last part of content matches the marker
-        if content[-marker_length:] == marker:
-            # Remove the marker from the content before returning
-            content = content[:-marker_length]
-            break
-    return read_bytes, content
+class Cursor:
+    """Read cursor over one buffer (usually a memory mapped file).
+
+    Provides the read/tell/seek subset of a file object, so all decode
+    functions work on it, but every read is just a slice of the buffer.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+        self.map = None
+
+    @classmethod
+    def open(cls, file_path):
+        with open(file_path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return cls(b'')
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        cursor = cls(data)
+        cursor.map = data
+        return cursor
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.data)
+
+    def read(self, length=-1):
+        end = len(self.data) if length < 0 else min(self.pos + length, len(self.data))
+        chunk = self.data[self.pos:end]
+        self.pos = end
+        return chunk
+
+    def peek(self, length=1):
+        return self.data[self.pos:self.pos + length]
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos):
+        self.pos = pos
+
+    def eof(self):
+        return self.pos >= len(self.data)
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+def read_until_marker(cursor, marker):
+    """Reads cursor content until a specific marker is found. Returns the content up to (but not including) the marker."""
+    index = cursor.data.find(marker, cursor.pos)
+    if index < 0:
+        # End of file reached without finding the marker
+        content = cursor.read()
+        return len(content) + 1, content
+    content = cursor.read(index - cursor.pos)
+    cursor.read(len(marker))
+    return len(content) + len(marker), content
 
 def debug_bytes_to_string(byte_data):
     """Convert bytes to two debug strings: colored hex representation and printable characters.
@@ -102,43 +152,26 @@ def debug_bytes_to_string(byte_data):
     
     return hex_string, char_string
 
-def parse_json_from_file(file):
-    prelude_bytes = b''  # To accumulate prelude data
-    json_str = ''  # Initialize an empty string to accumulate JSON data
-    depth = 0  # Keep track of the depth of nested objects
-    in_json = False  # Flag to indicate whether we've encountered the opening brace
-    prelude = ''  # To store prelude as string or hex string
-
-    while True:
-        byte = file.read(1)  # Read one byte at a time
-
-        if not byte:
-            # End of file reached
-            break
-
-        if not in_json and byte != b'{':
-            prelude_bytes += byte
-            continue
-
-        if byte == b'{':
-            if not in_json:  # Capture the prelude data
-                try:
-                    prelude = prelude_bytes.decode('utf-8')
-                except UnicodeDecodeError:
-                    prelude = prelude_bytes.hex()  # Use hex if not UTF-8 decodable
-            in_json = True
-            depth += 1
-        elif byte == b'}':
-            depth -= 1
-
-        if in_json:
-            # Accumulate the JSON string
-            json_str += byte.decode('utf-8')  # Safely decode
-            #json_str += byte.decode('utf-8', errors='replace')  # Safely decode
-
-        if in_json and depth == 0:
-            # All braces are matched; the JSON object is complete
-            break
+brace_pattern = re.compile(rb'[{}]')
+
+def parse_json_from_file(cursor):
+    """Reads the prelude up to the next '{' and the JSON object starting there (braces matched)."""
+    start = cursor.data.find(b'{', cursor.pos)
+    if start < 0:
+        # End of file reached
+        prelude_bytes = cursor.read()
+        json_str = ''
+    else:
+        prelude_bytes = cursor.read(start - cursor.pos)
+        depth = 0  # Keep track of the depth of nested objects
+        end = len(cursor.data)
+        for match in brace_pattern.finditer(cursor.data, start):
+            depth += 1 if match.group() == b'{' else -1
+            if depth == 0:
+                # All braces are matched; the JSON object is complete
+                end = match.end()
+                break
+        json_str = cursor.read(end - start).decode('utf-8')
 
     prelude_hex, prelude_chars = debug_bytes_to_string(prelude_bytes)
 
@@ -316,88 +349,89 @@ def debug_content(file):
 def hex_format(data):
     return " ".join([f"{byte:02x}" for byte in data])
 
-def parse_note_tree(f):
+def parse_note_tree(f, dbg=True):
+    """Parses one note tree record at the current position and returns it as dict."""
+    record = {"offset": f.tell(), "json": {}}
     start = f.read(5)
     assert(start[0] == 0x0a)
     assert(start[3] == 0x0a)
     assert(start[4] == 0x20)
     uuid = read_uuid(f)
+    record['uuid'] = uuid
 
     block = f.read(15)
-    print("block: ", hex_format(block))
+    if dbg:
+        print("block: ", hex_format(block))
     assert(block[13] == 0x31, hex_format(block))
     if block[14] == 0x22:
         assert(f.read(1)[0] == 0x20)
         uuid = read_uuid(f)
-        print("unknown uuid: ", uuid)
+        record['unknownUuid'] = uuid
+        if dbg:
+            print("unknown uuid: ", uuid)
         assert(f.read(1)[0] == 0x32)
     else:
         assert(block[14] == 0x32, hex_format(block))
 
-    print("peek: ", hex_format(peek(f, 10)))
+    if dbg:
+        print("peek: ", hex_format(peek(f, 10)))
     name = read_text(f)
+    record['name'] = name
 
-    print("uuid: ", uuid)
-    print("name: ", name)
+    if dbg:
+        print("uuid: ", uuid)
+        print("name: ", name)
     
     assert(f.read(1)[0] == 0x3a)
 
     active_scene = read_json_blob(f)
-    print("json: ", active_scene)
+    record['activeScene'] = active_scene
+    if dbg:
+        print("json: ", active_scene)
 
     # 0x40
     assert(f.read(1)[0] == 0x40)
-    f.read(1)
-    f.read(4)
-    f.read(4)
-    f.read(1)
-    f.read(1)
-
-
-    # 0x5a
-    assert(f.read(1)[0] == 0x5a)
-    json = read_json_blob(f)
-    print("json: ", json)
+    f.read(11)
 
-    assert(f.read(1)[0] == 0x62)
-    json = read_json_blob(f)
-    print("json: ", json)
-
-    assert(f.read(1)[0] == 0x6a)
-    json = read_json_blob(f)
-    print("json: ", json)
-
-    assert(f.read(1)[0] == 0x72)
-    json = read_json_blob(f)
-    print("json: ", json)
+    # 0x5a, 0x62, 0x6a, 0x72
+    for marker in (0x5a, 0x62, 0x6a, 0x72):
+        assert(f.read(1)[0] == marker)
+        json = read_json_blob(f)
+        record['json'][marker] = json
+        if dbg:
+            print("json: ", json)
 
     assert(f.read(1)[0] == 0x78)
     f.read(18)
     json = read_json_blob(f)
-    print("json: ", json)
+    record['json'][0x78] = json
+    if dbg:
+        print("json: ", json)
 
     # differs
     assert(f.read(1)[0] == 0xaa)
     f.read(1)
     json = read_json_blob(f)
-    print("json: ", json)
+    record['json'][0xaa] = json
+    if dbg:
+        print("json: ", json)
 
     # 0xb5
     assert(f.read(1)[0] == 0xb5)
-    f.read(4)
-    f.read(1)
+    f.read(5)
 
     # 0xbd
     assert(f.read(1)[0] == 0xbd)
-    f.read(4)
-    f.read(1)
+    f.read(5)
 
     # 0xc2
     assert(f.read(1)[0] == 0xc2)
     f.read(1)
     length = decode_length(f)
     unknown = f.read(length).decode('utf-8')
-    print("unknown: ", unknown)
+    record['unknown'] = unknown
+    if dbg:
+        print("unknown: ", unknown)
 
     # 0xd0
     assert(f.read(1)[0] == 0xd0)
@@ -414,27 +448,95 @@ def parse_note_tree(f):
     expected = bytes([0x0a, 0x73, 0x68, 0x61, 0x72, 0x65, 0x5f, 0x75, 0x73, 0x65, 0x72])
     unknown = f.read(11)
 
-    if peek(f, 1)[0] != 0x0a:
+    next_byte = peek(f, 1)
+    if len(next_byte) > 0 and next_byte[0] != 0x0a:
         f.read(3) # this is optional, could differ in size, we don't know
 
     assert unknown == expected, f"unknown does not end with the expected byte sequence. \nExpected: {expected.hex()}\nActual:   {unknown.hex()}"
 
-    next_start = peek(f, 5)
-    print("next start: ", next_start.hex())
-    print("")
-
+    if dbg:
+        next_start = peek(f, 5)
+        print("next start: ", next_start.hex())
+        print("")
+    return record
+
+def iter_note_tree(cursor, dbg=False):
+    """Yields the note tree records of a file one by one."""
+    while not cursor.eof():
+        yield parse_note_tree(cursor, dbg)
+
+def index_file_path(file_path):
+    return file_path + ".idx.json"
+
+def build_index(file_path):
+    """One pass over a note tree file, returns offset, uuid and name of every record."""
+    index = []
+    with Cursor.open(file_path) as cursor:
+        for record in iter_note_tree(cursor):
+            index.append({"offset": record['offset'], "uuid": str(record['uuid']), "name": record['name']})
+    return index
+
+def load_index(file_path):
+    """Returns the record index from the sidecar file, (re)builds it if missing or outdated."""
+    stat = os.stat(file_path)
+    try:
+        with open(index_file_path(file_path), 'r') as f:
+            data = json.load(f)
+        if data['size'] == stat.st_size and data['mtime'] == stat.st_mtime_ns:
+            return data['records']
+    except (OSError, ValueError, KeyError):
+        pass
+    index = build_index(file_path)
+    try:
+        with open(index_file_path(file_path), 'w') as f:
+            json.dump({"size": stat.st_size, "mtime": stat.st_mtime_ns, "records": index}, f)
+    except OSError as e:
+        print(f"Warning: could not write index {index_file_path(file_path)}: {e}")
+    return index
+
+def read_record(file_path, uuid, index=None):
+    """Seeks straight to the record with the given uuid, returns None if there is none."""
+    index = index if index is not None else load_index(file_path)
+    for entry in index:
+        if entry['uuid'] == str(uuid):
+            with Cursor.open(file_path) as cursor:
+                cursor.seek(entry['offset'])
+                return parse_note_tree(cursor, False)
+    return None
+
+def parse_records_at(args):
+    file_path, offsets = args
+    with Cursor.open(file_path) as cursor:
+        records = []
+        for offset in offsets:
+            cursor.seek(offset)
+            records.append(parse_note_tree(cursor, False))
+        return records
+
+def parse_records(file_path, index=None, jobs=None):
+    """Decodes all records in chunks on a process pool, using the record offsets from the index."""
+    index = index if index is not None else load_index(file_path)
+    offsets = [entry['offset'] for entry in index]
+    jobs = jobs if jobs is not None else os.cpu_count()
+    chunk_size = max(1, len(offsets) // (jobs * 4) + 1)
+    chunks = [(file_path, offsets[i:i + chunk_size]) for i in range(0, len(offsets), chunk_size)]
+    records = []
+    with multiprocessing.Pool(jobs) as pool:
+        for chunk in pool.map(parse_records_at, chunks):
+            records.extend(chunk)
+    return records
 
 def parse_file_for_offset_and_hex_uuid(file_path, debug):
     try:
-        with open(file_path, 'rb') as file:
+        with Cursor.open(file_path) as cursor:
 
             if debug:
-                debug_content(file)
+                debug_content(cursor)
             else:
-                #parse_header(file)
+                #parse_header(cursor)
 
-                while True:
-                    parse_note_tree(file)
+                for record in iter_note_tree(cursor, True):
+                    pass
 
     except IOError as e:
         print(f"Error reading file {file_path}: {e}")
@@ -442,6 +544,16 @@ def parse_file_for_offset_and_hex_uuid(file_path, debug):
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python script.py <path_to_binary_file>")
+        print("Usage: python script.py <path_to_binary_file> [-d | -i | -u <uuid>]")
+    elif len(sys.argv) > 2 and sys.argv[2] == "-i":
+        for entry in load_index(sys.argv[1]):
+            print(f"{entry['offset']:10d} {entry['uuid']} {entry['name']}")
+    elif len(sys.argv) > 3 and sys.argv[2] == "-u":
+        record = read_record(sys.argv[1], sys.argv[3])
+        if record is None:
+            print(f"No record with uuid {sys.argv[3]}")
+        else:
+            for key, value in record.items():
+                print(f"{key}: {value}")
     else:
         parse_file_for_offset_and_hex_uuid(sys.argv[1], len(sys.argv) > 2 and sys.argv[2] == "-d")
@@ -0,0 +1,229 @@
+import os
+import re
+import json
+import struct
+import hashlib
+import multiprocessing
+from collections import deque
+import skia
+from decode import open_catalog, render_page, load_strokes, get_file_info, PointFileError
+from cache import ParseCache
+from vector import write_svg, PdfWriter
+from prefetch import Prefetcher
+
+formats = ["png", "svg", "pdf"]
+manifest_name = "manifest.json"
+
+worker_cache = None
+worker_prefetcher = None
+
+def safe_name(name):
+    name = re.sub(r'[^\w\-. ]+', '_', name or "").strip(" .")
+    return name if name else "untitled"
+
+def page_file_name(pageNr, fmt="png"):
+    return f"page-{pageNr:04d}.{fmt}"
+
+def export_tasks(notebooks, name, output_dir, fmt="png", tolerance=0):
+    """Yields one (files, info, shapes, output, fmt, tolerance, notebook name) task per page that has point files.
+
+    Pages are written to <output_dir>/<notebook name>/page-<nr>.<fmt>, notebooks
+    with the same name get their id appended to the directory name. For pdf
+    output is the notebook document <output_dir>/<notebook name>.pdf instead.
+    """
+    used = set()
+    for notebook in notebooks['notebooks']:
+        if name is not None and notebook['name'] != name:
+            continue
+        dirname = safe_name(notebook['name'])
+        if dirname in used:
+            dirname = f"{dirname}-{notebook['id']}"
+        used.add(dirname)
+        pages = [page for page in notebook['pages'] if len(page['points']) > 0]
+        if len(pages) > 0 and hasattr(notebook, 'load_all'):
+            notebook.load_all() # one query per table instead of one per page
+        for page in pages:
+            point_dir = os.path.join(notebooks['basedir'], "point", notebook['id'], page['id'])
+            files = [os.path.join(point_dir, point) for point in sorted(page['points'])]
+            if fmt == "pdf":
+                output = os.path.join(output_dir, f"{dirname}.pdf")
+            else:
+                output = os.path.join(output_dir, dirname, page_file_name(page['pageNr'], fmt))
+            yield (files, page['info'], page['shapes'], output, fmt, tolerance, notebook['name'])
+
+def init_worker(cache_dir, cache_size, io_threads=0, io_buffer=0):
+    global worker_cache, worker_prefetcher
+    worker_cache = ParseCache(cache_dir, cache_size) if cache_dir is not None else None
+    worker_prefetcher = Prefetcher(io_threads, io_buffer, worker_cache) if io_threads > 0 else None
+
+def load_page_strokes(task):
+    files, info, shapes, output, fmt, tolerance, notebook = task
+    return load_strokes(files, shapes, False, worker_cache, worker_prefetcher).simplify(tolerance)
+
+def export_page(task):
+    files, info, shapes, output, fmt, tolerance, notebook = task
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    if fmt == "svg":
+        write_svg(output, load_page_strokes(task), info)
+    else:
+        image, found_count = render_page(files, info, shapes, [], [], False, worker_cache, prefetcher=worker_prefetcher)
+        image.save(output, skia.kPNG)
+    return output
+
+def bounded_imap(pool, function, tasks, limit):
+    """Like pool.imap, but at most limit tasks are running or waiting to be consumed.
+
+    pool.imap runs ahead of a slow consumer, for pdf export every finished
+    page would be held as decoded StrokeStore in the parent.
+    """
+    pending = deque()
+    for task in tasks:
+        if len(pending) >= limit:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(function, (task,)))
+    while len(pending) > 0:
+        yield pending.popleft().get()
+
+def export_pdf(tasks, imap):
+    """Writes one pdf per notebook, pages are decoded by imap in order and added one at a time."""
+    outputs = []
+    writer = None
+    for task, store in zip(tasks, imap(load_page_strokes, tasks)):
+        output, info = task[3], task[1]
+        if writer is None or output != outputs[-1]:
+            if writer is not None:
+                writer.close()
+            os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+            writer = PdfWriter(output)
+            outputs.append(output)
+        writer.add_page(store, info)
+        yield output
+    if writer is not None:
+        writer.close()
+
+def page_fingerprint(task):
+    """Hash over everything that changes the output of a page.
+
+    Covers page size and export options, id, status and matrix of every
+    shape in NewShapeModel and the trailer index of every point file.
+    """
+    files, info, shapes, output, fmt, tolerance, notebook = task
+    fingerprint = hashlib.sha1()
+    fingerprint.update(json.dumps([info, fmt, tolerance], sort_keys=True).encode('utf-8'))
+    for shape in sorted(shapes, key=lambda shape: str(shape['shapeId'])):
+        fingerprint.update(json.dumps([str(shape['shapeId']), shape['status'], shape['matrix']], sort_keys=True).encode('utf-8'))
+    for file in files:
+        fingerprint.update(os.path.basename(file).encode('utf-8'))
+        try:
+            for entry in get_file_info(file, False):
+                fingerprint.update(entry['id'] + struct.pack(">ii", entry['start'], entry['length']))
+        except PointFileError as e:
+            # skipped when rendering, re-rendered once the file changes
+            fingerprint.update(str(e).encode('utf-8'))
+    return fingerprint.hexdigest()
+
+def load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, manifest_name), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(output_dir, manifest):
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, manifest_name)
+    with open(path + ".tmp", 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def changed_tasks(tasks, output_dir, name=None):
+    """Compares the page fingerprints with the manifest of the previous export.
+
+    Returns the tasks of outputs that are new or changed and the new
+    manifest; outputs of pages that no longer exist are deleted. If only
+    notebook name is exported, the entries of other notebooks are kept.
+    """
+    old_manifest = load_manifest(output_dir)
+    fingerprints = {}
+    notebooks = {}
+    for task in tasks:
+        # a pdf covers all pages of a notebook
+        output = os.path.relpath(task[3], output_dir)
+        fingerprints.setdefault(output, hashlib.sha1()).update(page_fingerprint(task).encode('utf-8'))
+        notebooks[output] = task[6]
+    manifest = {output: {"notebook": notebooks[output], "fingerprint": fingerprint.hexdigest()}
+                for output, fingerprint in fingerprints.items()}
+    changed = set(output for output, entry in manifest.items()
+                  if old_manifest.get(output) != entry or not os.path.exists(os.path.join(output_dir, output)))
+    removed = set()
+    for output, entry in old_manifest.items():
+        if output in manifest:
+            continue
+        if name is not None and entry.get('notebook') != name:
+            manifest[output] = entry
+            continue
+        removed.add(output)
+    for output in sorted(removed):
+        path = os.path.join(output_dir, output)
+        if os.path.exists(path):
+            os.remove(path)
+            print(f"removed {path}")
+        try:
+            os.rmdir(os.path.dirname(path))
+        except OSError:
+            pass
+    print(f"{len(changed)} changed, {len(fingerprints) - len(changed)} unchanged, {len(removed)} removed")
+    return [task for task in tasks if os.path.relpath(task[3], output_dir) in changed], manifest
+
+def read_ahead(tasks):
+    """Yields the tasks in order and starts reading the point files of the next page meanwhile."""
+    for i, task in enumerate(tasks):
+        if worker_prefetcher is not None and i + 1 < len(tasks):
+            worker_prefetcher.prefetch(tasks[i + 1][0], [str(shape['shapeId']) for shape in tasks[i + 1][2]])
+        yield task
+
+def export_backup(dir, name, output_dir, jobs, cache=None, fmt="png", tolerance=0, incremental=False, io_threads=0, io_buffer=64*1024*1024):
+    """Renders all pages of a notebook (or all notebooks if name is None) with a process pool.
+
+    With incremental only pages that changed since the last export into
+    output_dir are rendered (see changed_tasks). With io_threads every
+    process reads the point files of a page concurrently, a single process
+    also reads the next page ahead.
+    """
+    tasks = list(export_tasks(open_catalog(dir, cache), name, output_dir, fmt, tolerance))
+    manifest = None
+    if incremental:
+        tasks, manifest = changed_tasks(tasks, output_dir, name)
+    if len(tasks) == 0:
+        print("No pages to export")
+        if manifest is not None:
+            save_manifest(output_dir, manifest)
+        return []
+    init_args = (cache.dir if cache is not None else None, cache.max_size if cache is not None else 0, io_threads, io_buffer)
+    outputs = []
+    def run(imap):
+        if fmt == "pdf":
+            results = export_pdf(tasks, imap)
+        else:
+            results = imap(export_page, tasks)
+        for output in results:
+            outputs.append(output)
+            print(f"[{len(outputs)}/{len(tasks)}] {output}")
+    if jobs is None or jobs > 1:
+        with multiprocessing.Pool(jobs, init_worker, init_args) as pool:
+            if fmt == "pdf":
+                # pages are added by the single writer in the parent, keep two per process in flight
+                limit = 2 * (jobs if jobs is not None else os.cpu_count())
+                run(lambda function, tasks: bounded_imap(pool, function, tasks, limit))
+            else:
+                run(pool.imap_unordered)
+    else:
+        init_worker(*init_args)
+        try:
+            run(lambda function, tasks: map(function, read_ahead(tasks)))
+        finally:
+            if worker_prefetcher is not None:
+                worker_prefetcher.close()
+    if manifest is not None:
+        save_manifest(output_dir, manifest)
+    return sorted(set(outputs))
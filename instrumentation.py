@@ -0,0 +1,81 @@
+import json
+import time
+import threading
+
+# Lightweight per-stage timing and counters for --profile. While disabled,
+# stage() returns a shared no-op context manager and count() returns
+# immediately, so the instrumented code pays one global lookup per call.
+# Stages and counters can be updated from several threads (prefetch.py),
+# the times of overlapping stages are summed.
+
+enabled = False
+stages = {}
+counters = {}
+started = None
+lock = threading.Lock()
+
+class NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+null_stage = NullStage()
+
+class Stage:
+    __slots__ = ('name', 'wall', 'cpu')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        with lock:
+            entry = stages.get(self.name)
+            if entry is None:
+                entry = stages[self.name] = {"calls": 0, "wall": 0.0, "cpu": 0.0}
+            entry['calls'] += 1
+            entry['wall'] += wall
+            entry['cpu'] += cpu
+        return False
+
+def enable():
+    global enabled, started
+    enabled = True
+    started = (time.perf_counter(), time.process_time())
+    stages.clear()
+    counters.clear()
+
+def disable():
+    global enabled
+    enabled = False
+
+def stage(name):
+    """Context manager timing a stage (wall and cpu time), no-op while disabled."""
+    if not enabled:
+        return null_stage
+    return Stage(name)
+
+def count(name, value=1):
+    if not enabled:
+        return
+    with lock:
+        counters[name] = counters.get(name, 0) + value
+
+def report():
+    with lock:
+        result = {"stages": {name: dict(entry) for (name, entry) in stages.items()}, "counters": dict(counters)}
+    if started is not None:
+        result['total'] = {"wall": time.perf_counter() - started[0], "cpu": time.process_time() - started[1]}
+    return result
+
+def write_report(path):
+    with open(path, 'w') as f:
+        json.dump(report(), f, indent=1)
@@ -0,0 +1,101 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import archive
+import instrumentation
+from decode import PointFile, PointFileError, read_points_cached
+
+class ByteBudget:
+    """Limits the bytes read but not yet decoded, a file larger than the limit is read alone."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, size):
+        with self.condition:
+            while self.in_flight > 0 and self.in_flight + size > self.max_bytes:
+                self.condition.wait()
+            self.in_flight += size
+
+    def release(self, size):
+        with self.condition:
+            self.in_flight -= size
+            self.condition.notify_all()
+
+class Prefetcher:
+    """Reads and decodes point files on a thread pool.
+
+    Every file is read in one go (a single large request on network
+    storage) and decoded in the same thread, at most max_bytes of raw file
+    data are held at a time. prefetch() starts on the files of a page that
+    will be needed next, points() hands out the decoded shapes of a page in
+    the order the files finish. Like PointFile.read_shapes only the shape ids
+    asked for are decoded, erased strokes are skipped.
+    """
+
+    def __init__(self, jobs=4, max_bytes=64*1024*1024, cache=None, dbg=False):
+        self.pool = ThreadPoolExecutor(jobs)
+        self.budget = ByteBudget(max_bytes)
+        self.cache = cache
+        self.dbg = dbg
+        self.futures = {}
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def read_file(self, file, ids=None):
+        """Shapes of a point file as [(x, y, pressure, id)], only the given ids are decoded (all if None)."""
+        if self.cache is not None:
+            # cache entries hold the whole file
+            points = read_points_cached(file, self.cache, self.dbg)
+            return points if ids is None else [p for p in points if p[3] in ids]
+        size = archive.getsize(file)
+        self.budget.acquire(size)
+        try:
+            with archive.open_file(file) as f:
+                data = f.read()
+            instrumentation.count("bytes prefetched", len(data))
+            with PointFile(file, self.dbg, data) as point_file:
+                return point_file.read_shapes(ids)
+        finally:
+            self.budget.release(size)
+
+    def fetch(self, file, ids=None):
+        """Future of the points of a file, reused if an earlier fetch decodes at least the given ids."""
+        ids = None if ids is None else frozenset(ids)
+        with self.lock:
+            entry = self.futures.get(file)
+            if entry is None or (entry[1] is not None and (ids is None or not ids <= entry[1])):
+                entry = self.futures[file] = (self.pool.submit(self.read_file, file, ids), ids)
+            return entry[0]
+
+    def prefetch(self, files, ids=None):
+        """Starts reading files in the background, ids are the shapes that will be asked for."""
+        for file in files:
+            self.fetch(file, ids)
+
+    def points(self, files, ids=None):
+        """Yields (file index, points) as soon as each file is decoded, only shapes in ids are decoded."""
+        done = queue.Queue()
+        for i, file in enumerate(files):
+            self.fetch(file, ids).add_done_callback(lambda future, i=i: done.put((i, future)))
+        for n in range(len(files)):
+            i, future = done.get()
+            with self.lock:
+                self.futures.pop(files[i], None)
+            try:
+                points = future.result()
+            except PointFileError as e:
+                print(f"Warning: skipping corrupt point file {files[i]}: {e}")
+                points = []
+            yield i, points if ids is None else [p for p in points if p[3] in ids]
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+        self.futures = {}
@@ -0,0 +1,76 @@
+import numpy as np
+import skia
+import instrumentation
+
+stroke_color = skia.ColorBLUE
+stroke_width = 2
+
+# SkPath serialization (version 5): header, points, verbs padded to 4 bytes
+path_version = 5
+move_verb = 0
+line_verb = 1
+
+def stroke_paint_key(shape):
+    """Hashable (color, width) key of the paint a shape is drawn with."""
+    return (stroke_color, stroke_width)
+
+def make_paint(key):
+    color, width = key
+    return skia.Paint(AntiAlias=True, Style=skia.Paint.kStroke_Style, StrokeWidth=width, Color=color)
+
+def path_from_runs(runs):
+    """Builds one path with an open contour for every (x, y) run."""
+    runs = [(x, y) for (x, y) in runs if len(x) > 0]
+    if len(runs) == 0:
+        return skia.Path()
+    offsets = np.zeros(len(runs) + 1, dtype=np.int64)
+    np.cumsum([len(x) for (x, y) in runs], out=offsets[1:])
+    points = np.empty((int(offsets[-1]), 2), dtype=np.float32)
+    points[:, 0] = np.concatenate([x for (x, y) in runs])
+    points[:, 1] = np.concatenate([y for (x, y) in runs])
+    return path_from_points(points, offsets)
+
+def path_from_points(points, offsets):
+    """Builds one path from a (n, 2) point buffer with an open contour per offsets range.
+
+    The path is assembled as serialized SkPath in NumPy and loaded with a
+    single readFromMemory call, falling back to moveTo/lineTo if this skia
+    version uses a different serialization format.
+    """
+    counts = np.diff(offsets)
+    starts = offsets[:-1][counts > 0] - offsets[0]
+    count = int(offsets[-1] - offsets[0])
+    points = points[offsets[0]:offsets[-1]]
+    path = skia.Path()
+    if count == 0:
+        return path
+    verbs = np.full(count, line_verb, dtype=np.uint8)
+    verbs[starts] = move_verb
+    header = np.array([path_version, count, 0, count], dtype='<i4')
+    buffer = header.tobytes() + points.astype('<f4', copy=False).tobytes() + verbs.tobytes() + bytes(-count % 4)
+    if path.readFromMemory(buffer) == len(buffer):
+        return path
+    path = skia.Path()
+    for i, (x, y) in enumerate(points.tolist()):
+        if verbs[i] == move_verb:
+            path.moveTo(x, y)
+        else:
+            path.lineTo(x, y)
+    return path
+
+def path_from_store(store):
+    """One path with a contour per stroke of a StrokeStore."""
+    return path_from_points(store.coords, store.offsets)
+
+def draw_strokes(canvas, store):
+    """Draws the strokes of a StrokeStore, one drawPath per paint."""
+    groups = {}
+    for i, shape in enumerate(store.shapes):
+        groups.setdefault(stroke_paint_key(shape), []).append(i)
+    for key, indices in groups.items():
+        strokes = store if len(groups) == 1 else store.select(indices)
+        with instrumentation.stage("path building"):
+            path = path_from_store(strokes)
+        with instrumentation.stage("draw"):
+            canvas.drawPath(path, make_paint(key))
+    instrumentation.count("shapes drawn", len(store))
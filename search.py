@@ -0,0 +1,141 @@
+import os
+import re
+import gzip
+import json
+from bisect import bisect_left
+from decode import open_catalog, catalog_signature
+
+index_file_name = "hwr_index.json.gz"
+
+# weight of a term depending on where it was found
+result_weight = 1.0
+candidate_weight = 0.5
+
+def tokenize(text):
+    """Splits recognized text into normalized (case folded) terms."""
+    return re.findall(r"\w+", text.casefold())
+
+def candidate_texts(candidates):
+    """The candidates column is usually a json list, fall back to plain text."""
+    if not candidates:
+        return []
+    try:
+        value = json.loads(candidates)
+    except ValueError:
+        return [candidates]
+    texts = []
+    values = value if isinstance(value, list) else [value]
+    for value in values:
+        if isinstance(value, str):
+            texts.append(value)
+        elif isinstance(value, dict):
+            texts.extend(v for v in value.values() if isinstance(v, str))
+    return texts
+
+class HwrIndex:
+    """Inverted index over the HWR results of all notebooks in a backup.
+
+    Every recognized word is stored once as entry (notebook id, notebook name,
+    page id, page number, bounding rect, text), terms map to a list of
+    (entry, weight) postings.
+    """
+
+    def __init__(self, signature=""):
+        self.signature = signature
+        self.entries = []
+        self.postings = {}
+        self.terms = []
+
+    def add(self, notebook, page, hwr):
+        entry = len(self.entries)
+        r = hwr['boundingRect']
+        self.entries.append([notebook['id'], notebook['name'], page['id'], page['pageNr'],
+                             [r['left'], r['top'], r['right'], r['bottom']], hwr['result']])
+        weights = {}
+        for term in tokenize(hwr['result'] or ""):
+            weights[term] = result_weight
+        for text in candidate_texts(hwr['candidates']):
+            for term in tokenize(text):
+                weights.setdefault(term, candidate_weight)
+        for term, weight in weights.items():
+            self.postings.setdefault(term, []).append((entry, weight))
+
+    def build(self, notebooks):
+        for notebook in notebooks['notebooks']:
+            if hasattr(notebook, 'load_all'):
+                notebook.load_all()
+            for page in notebook['pages']:
+                for hwr in page['hwr']:
+                    self.add(notebook, page, hwr)
+        self.terms = sorted(self.postings)
+        return self
+
+    def save(self, path):
+        data = {"signature": self.signature, "entries": self.entries, "postings": self.postings}
+        tmp = path + ".tmp"
+        with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        index = cls(data['signature'])
+        index.entries = data['entries']
+        index.postings = data['postings']
+        index.terms = sorted(index.postings)
+        return index
+
+    def matching_terms(self, term, prefix):
+        if not prefix:
+            return [term] if term in self.postings else []
+        terms = []
+        i = bisect_left(self.terms, term)
+        while i < len(self.terms) and self.terms[i].startswith(term):
+            terms.append(self.terms[i])
+            i = i + 1
+        return terms
+
+    def search(self, query, prefix=False, limit=None):
+        """Returns hits as dicts sorted by rank, best first.
+
+        Exact matches of the recognized word rank highest, candidate and
+        prefix matches lower. Hits for multiple query terms are summed.
+        """
+        scores = {}
+        for query_term in tokenize(query):
+            for term in self.matching_terms(query_term, prefix):
+                closeness = len(query_term) / len(term)
+                for entry, weight in self.postings[term]:
+                    scores[entry] = scores.get(entry, 0) + weight * closeness
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        if limit is not None:
+            ranked = ranked[:limit]
+        hits = []
+        for entry, score in ranked:
+            notebookId, notebookName, pageId, pageNr, rect, text = self.entries[entry]
+            hits.append({"notebook": notebookName, "notebookId": notebookId, "pageId": pageId, "pageNr": pageNr,
+                         "boundingRect": dict(zip(("left", "top", "right", "bottom"), rect)),
+                         "text": text, "score": score})
+        return hits
+
+def open_index(dir, path=None, cache=None):
+    """Loads the index stored next to the backup, (re)builds it if missing or outdated."""
+    if path is None:
+        # archived backups get the index next to the archive
+        path = os.path.join(dir, index_file_name) if os.path.isdir(dir) else f"{dir}.{index_file_name}"
+    signature = catalog_signature(dir).decode('utf-8')
+    if os.path.exists(path):
+        try:
+            index = HwrIndex.load(path)
+            if index.signature == signature:
+                return index
+        except (OSError, ValueError, KeyError):
+            pass
+    index = HwrIndex(signature).build(open_catalog(dir, cache))
+    try:
+        index.save(path)
+    except OSError as e:
+        print(f"Warning: could not save search index to {path}: {e}")
+    return index
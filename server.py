@@ -0,0 +1,224 @@
+import os
+import sys
+import json
+import math
+import signal
+import threading
+import argparse
+import socketserver
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import skia
+from decode import read_db, read_db_cached, load_strokes, render_page, parse_rect
+from cache import ParseCache
+from search import open_index
+
+class SizedCache:
+    """Thread safe LRU that is kept below max_size, sizeof gives the size of a value."""
+
+    def __init__(self, max_size, sizeof):
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_size:
+            return
+        with self.lock:
+            if key in self.items:
+                self.size -= self.sizeof(self.items.pop(key))
+            self.items[key] = value
+            self.size += size
+            while self.size > self.max_size:
+                key, old = self.items.popitem(last=False)
+                self.size -= self.sizeof(old)
+
+def store_size(store):
+    return store.coords.nbytes + store.pressure.nbytes + store.offsets.nbytes + store.bounds.nbytes
+
+class BackupServer:
+    """Keeps a parsed backup in memory and serves listings, page renders and search.
+
+    The catalog (with shapes and hwr of all pages) and the search index are
+    loaded once. Decoded pages and rendered png images are kept in bounded
+    LRU caches, renders run on a thread pool of jobs threads.
+    """
+
+    def __init__(self, dir, jobs=None, cache=None, page_cache_size=256*1024*1024, image_cache_size=64*1024*1024):
+        self.dir = dir
+        self.cache = cache
+        self.notebooks = read_db_cached(dir, cache) if cache is not None else read_db(dir)
+        self.index = open_index(dir, cache=cache)
+        self.pages = {}
+        for notebook in self.notebooks['notebooks']:
+            for page in notebook['pages']:
+                point_dir = os.path.join(self.notebooks['basedir'], "point", notebook['id'], page['id'])
+                self.pages[page['id']] = (notebook, page, [os.path.join(point_dir, point) for point in page['points']])
+        self.strokes = SizedCache(page_cache_size, store_size)
+        self.images = SizedCache(image_cache_size, len)
+        self.pool = ThreadPoolExecutor(jobs if jobs is not None else os.cpu_count())
+
+    def find_page(self, notebook, pageNr):
+        """Page entry by notebook name or id and page number, None if unknown."""
+        for (entry, page, files) in self.pages.values():
+            if notebook in (entry['name'], entry['id']) and page['pageNr'] == pageNr:
+                return entry, page, files
+        return None
+
+    def listing(self):
+        return [{"name": notebook['name'], "id": notebook['id'],
+                 "pages": [{"pageNr": page['pageNr'], "id": page['id'], "info": page['info'], "empty": len(page['points']) == 0}
+                           for page in notebook['pages']]}
+                for notebook in self.notebooks['notebooks']]
+
+    def page_strokes(self, pageId):
+        strokes = self.strokes.get(pageId)
+        if strokes is None:
+            notebook, page, files = self.pages[pageId]
+            strokes = load_strokes(files, page['shapes'], False, self.cache)
+            self.strokes.put(pageId, strokes)
+        return strokes
+
+    def render_png(self, pageId, words=(), crop=None, zoom=1):
+        key = (pageId, tuple(sorted(words)), crop, zoom)
+        data = self.images.get(key)
+        if data is None:
+            notebook, page, files = self.pages[pageId]
+            image, found_count = render_page(files, page['info'], page['shapes'], page['hwr'], words, False,
+                                             crop=crop, zoom=zoom, strokes=self.page_strokes(pageId))
+            data = bytes(image.encodeToData(skia.kPNG, 100))
+            self.images.put(key, data)
+        return data
+
+    def render(self, pageId, words=(), crop=None, zoom=1):
+        """Renders on the pool, blocks the calling request thread until done."""
+        return self.pool.submit(self.render_png, pageId, words, crop, zoom).result()
+
+    def search(self, query, prefix=False, limit=50):
+        return self.index.search(query, prefix, limit)
+
+    def close(self):
+        self.pool.shutdown()
+
+# largest zoom of /render, the surface of a page grows with its square
+max_zoom = 8
+
+def parse_zoom(value):
+    zoom = float(value)
+    if not math.isfinite(zoom) or zoom <= 0 or zoom > max_zoom:
+        raise ValueError(f"zoom must be in (0, {max_zoom}]")
+    return zoom
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """GET /notebooks, /render?notebook=&page=[&zoom=&crop=&find=] and /search?q=[&prefix=1&limit=]"""
+
+    backup = None
+
+    def send(self, status, body, content_type="application/json"):
+        if content_type == "application/json":
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            if url.path == "/notebooks":
+                self.send(200, self.backup.listing())
+            elif url.path == "/render":
+                page = self.backup.find_page(query.get('notebook'), int(query.get('page', 0)))
+                if page is None or len(page[1]['points']) == 0:
+                    self.send(404, {"error": "no such page with content"})
+                    return
+                crop = parse_rect(query['crop']) if 'crop' in query else None
+                if crop is not None and not all(math.isfinite(v) for v in crop):
+                    raise ValueError("crop must be finite")
+                zoom = parse_zoom(query.get('zoom', 1))
+                words = [word for word in query.get('find', "").split(",") if word != ""]
+                data = self.backup.render(page[1]['id'], words, crop, zoom)
+                self.send(200, data, "image/png")
+            elif url.path == "/search":
+                hits = self.backup.search(query.get('q', ""), query.get('prefix', "0") not in ("0", ""), int(query.get('limit', 50)))
+                self.send(200, hits)
+            else:
+                self.send(404, {"error": "unknown path"})
+        except (ValueError, argparse.ArgumentTypeError) as e:
+            self.send(400, {"error": str(e)})
+        except Exception as e:
+            # answer instead of dropping the connection, the error goes to the log
+            self.log_error("%s failed: %r", self.path, e)
+            self.send(500, {"error": "internal error"})
+
+    def address_string(self):
+        # unix socket clients have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = "localhost", 0
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve page renders, listings and search of a Boox Notes backup.')
+    parser.add_argument('--directory', dest='dir', required=True,
+                        help='Directory (or zip/tar archive) of the Boox Notes backup')
+    parser.add_argument('--host', dest='host', default="127.0.0.1",
+                        help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', dest='port', type=int, default=8765,
+                        help='Port to listen on (default: 8765)')
+    parser.add_argument('--socket', dest='socket',
+                        help='Listen on this unix socket instead of a TCP port')
+    parser.add_argument('--jobs', dest='jobs', type=int, default=os.cpu_count(),
+                        help='Number of render threads (default: number of CPUs)')
+    parser.add_argument('--cache', dest='cache',
+                        help='Directory for caching parsed databases and point files between runs')
+    parser.add_argument('--cache-size', dest='cache_size', type=int, default=512,
+                        help='Maximum size of the cache directory in MB (default: 512)')
+    parser.add_argument('--page-cache', dest='page_cache', type=int, default=256,
+                        help='Memory for decoded pages in MB (default: 256)')
+    parser.add_argument('--image-cache', dest='image_cache', type=int, default=64,
+                        help='Memory for rendered png images in MB (default: 64)')
+    args = parser.parse_args()
+
+    cache = ParseCache(args.cache, args.cache_size*1024*1024) if args.cache else None
+    RequestHandler.backup = BackupServer(args.dir, args.jobs, cache, args.page_cache*1024*1024, args.image_cache*1024*1024)
+    if args.socket is not None:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = UnixHTTPServer(args.socket, RequestHandler)
+        print(f"Serving {args.dir} on {args.socket}")
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), RequestHandler)
+        print(f"Serving {args.dir} on http://{args.host}:{server.server_port}")
+    # clean up the socket and spooled databases when stopped by a service manager
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        RequestHandler.backup.close()
+        if args.socket is not None and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+if __name__ == "__main__":
+    main()
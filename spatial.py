@@ -0,0 +1,85 @@
+import numpy as np
+
+def rect_array(rects):
+    """(n, 4) float array of left, top, right, bottom from boundingRect dicts."""
+    boxes = np.empty((len(rects), 4), dtype=np.float64)
+    for i, r in enumerate(rects):
+        boxes[i] = (r['left'], r['top'], r['right'], r['bottom'])
+    return boxes
+
+class GridIndex:
+    """Uniform grid over axis aligned (left, top, right, bottom) boxes.
+
+    Every box is registered in all cells it overlaps, queries only test the
+    boxes registered in the cells of the query rectangle.
+    """
+
+    def __init__(self, boxes, cell_size=256):
+        self.boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        self.cell_size = cell_size
+        self.cells = {}
+        cells = np.floor(self.boxes / cell_size).astype(np.int64)
+        for i, (left, top, right, bottom) in enumerate(cells.tolist()):
+            for cx in range(left, right + 1):
+                for cy in range(top, bottom + 1):
+                    self.cells.setdefault((cx, cy), []).append(i)
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def candidates(self, left, top, right, bottom):
+        left, top, right, bottom = (int(np.floor(v / self.cell_size)) for v in (left, top, right, bottom))
+        found = set()
+        if (right - left + 1) * (bottom - top + 1) > len(self.cells):
+            for (cx, cy), indices in self.cells.items():
+                if left <= cx <= right and top <= cy <= bottom:
+                    found.update(indices)
+        else:
+            for cx in range(left, right + 1):
+                for cy in range(top, bottom + 1):
+                    found.update(self.cells.get((cx, cy), ()))
+        return np.array(sorted(found), dtype=np.int64)
+
+    def query(self, left, top, right, bottom):
+        """Indices of all boxes intersecting the rectangle, in insertion order."""
+        indices = self.candidates(left, top, right, bottom)
+        boxes = self.boxes[indices]
+        hit = (boxes[:, 0] <= right) & (boxes[:, 2] >= left) & (boxes[:, 1] <= bottom) & (boxes[:, 3] >= top)
+        return indices[hit]
+
+    def nearest(self, x, y, radius):
+        """Indices of boxes within radius of a point, closest first."""
+        indices = self.candidates(x - radius, y - radius, x + radius, y + radius)
+        boxes = self.boxes[indices]
+        dx = np.maximum(np.maximum(boxes[:, 0] - x, 0), x - boxes[:, 2])
+        dy = np.maximum(np.maximum(boxes[:, 1] - y, 0), y - boxes[:, 3])
+        distance = np.hypot(dx, dy)
+        near = distance <= radius
+        order = np.argsort(distance[near], kind='stable')
+        return indices[near][order]
+
+class PageIndex:
+    """Spatial index over the shape and HWR bounding rects of a page (as loaded by read_shape_db)."""
+
+    def __init__(self, shapes, hwr, cell_size=256):
+        self.shapes = list(shapes)
+        self.hwr = list(hwr)
+        self.shape_grid = GridIndex(rect_array([shape['boundingRect'] for shape in self.shapes]), cell_size)
+        self.hwr_grid = GridIndex(rect_array([found['boundingRect'] for found in self.hwr]), cell_size)
+
+    def shapes_in(self, left, top, right, bottom, margin=0):
+        """Shapes whose bounding rect intersects the rectangle (grown by margin)."""
+        indices = self.shape_grid.query(left - margin, top - margin, right + margin, bottom + margin)
+        return [self.shapes[i] for i in indices]
+
+    def stroke_ids_in(self, left, top, right, bottom, margin=0):
+        return set(str(shape['shapeId']) for shape in self.shapes_in(left, top, right, bottom, margin))
+
+    def words_near(self, x, y, radius=0):
+        """Recognized words whose bounding rect is within radius of a point, closest first."""
+        return [self.hwr[i] for i in self.hwr_grid.nearest(x, y, radius)]
+
+    def strokes_under(self, found, margin=0):
+        """Shapes below a recognized word (an HWR entry)."""
+        r = found['boundingRect']
+        return self.shapes_in(r['left'], r['top'], r['right'], r['bottom'], margin)
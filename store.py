@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import archive
+
+# Content-addressed store for many snapshots of the same backup. Every file
+# is stored once as objects/<sha256[:2]>/<sha256[2:]>, a snapshot is a json
+# manifest snapshots/<name>.snapshot mapping the paths of the backup to their
+# objects. The manifest path can be passed anywhere a backup directory is
+# expected, archive.py reads the snapshot from the store.
+
+# written into the backup directory by search.py, rebuilt for every snapshot
+skipped_files = {"hwr_index.json.gz"}
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with archive.open_file(path) as f:
+        for chunk in iter(lambda: f.read(1024*1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def backup_files(dir, prefix=""):
+    """Yields the member names (relative, / separated) of every file of a backup directory or archive."""
+    if archive.is_archive(dir):
+        names = archive.open_archive(dir).listdir(prefix)
+    else:
+        names = os.listdir(os.path.join(dir, *prefix.split("/")))
+    for name in names:
+        member = f"{prefix}/{name}" if prefix else name
+        if archive.isdir(os.path.join(dir, *member.split("/"))):
+            yield from backup_files(dir, member)
+        elif member not in skipped_files and not member.endswith("-shm"):
+            # -shm is SQLite's shared memory index of a WAL database, rebuilt on every open
+            yield member
+
+class Store:
+    """Deduplicating store of backup snapshots.
+
+    Files are hashed with sha256 and copied into the store only if no
+    snapshot has the same contents yet. Ingest skips hashing files whose
+    size and modification time match the previous snapshot, so the time
+    and disk space of an ingest grow with the amount of change.
+    """
+
+    def __init__(self, dir):
+        self.dir = dir
+        self.objects_dir = os.path.join(dir, "objects")
+        self.snapshots_dir = os.path.join(dir, "snapshots")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+
+    def snapshot_path(self, name):
+        return os.path.join(self.snapshots_dir, name + archive.snapshot_suffix)
+
+    def snapshots(self):
+        """Names of all snapshots, oldest first."""
+        entries = [entry for entry in os.scandir(self.snapshots_dir) if entry.name.endswith(archive.snapshot_suffix)]
+        entries.sort(key=lambda entry: (entry.stat().st_mtime_ns, entry.name))
+        return [entry.name[:-len(archive.snapshot_suffix)] for entry in entries]
+
+    def manifest(self, name):
+        with open(self.snapshot_path(name)) as f:
+            return json.load(f)
+
+    def has_object(self, digest):
+        return os.path.exists(archive.object_path(self.dir, digest))
+
+    def add_object(self, path, digest):
+        """Copies a file into the store unless its contents are stored already, returns the bytes written."""
+        target = archive.object_path(self.dir, digest)
+        if os.path.exists(target):
+            return 0
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.objects_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f, archive.open_file(path) as source:
+                shutil.copyfileobj(source, f, 1024*1024)
+            os.chmod(tmp, 0o444)
+            os.replace(tmp, target)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        return os.path.getsize(target)
+
+    def ingest(self, source, name=None, jobs=8):
+        """Adds a backup directory (or archive) as snapshot, returns counts of files, hashed files and new objects."""
+        if name is None:
+            name = os.path.basename(os.path.normpath(source))
+        target = self.snapshot_path(name)
+        if os.path.exists(target):
+            raise FileExistsError(f"snapshot {name} already exists in {self.dir}")
+        snapshots = self.snapshots()
+        previous = self.manifest(snapshots[-1])['files'] if len(snapshots) > 0 else {}
+
+        def import_file(member):
+            path = os.path.join(source, *member.split("/"))
+            size, mtime = archive.stat(path)
+            entry = previous.get(member)
+            if entry is not None and entry['size'] == size and entry['mtime'] == mtime and self.has_object(entry['sha256']):
+                return member, entry, False, 0
+            digest = hash_file(path)
+            return member, {"sha256": digest, "size": size, "mtime": mtime}, True, self.add_object(path, digest)
+
+        with ThreadPoolExecutor(jobs) as pool:
+            results = list(pool.map(import_file, backup_files(source)))
+
+        manifest = {"name": name, "source": os.path.abspath(source), "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                    "files": {member: entry for (member, entry, hashed, written) in results}}
+        fd, tmp = tempfile.mkstemp(dir=self.snapshots_dir, suffix=".tmp")
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp, target)
+        return {"name": name, "path": target, "files": len(results),
+                "hashed": sum(1 for result in results if result[2]),
+                "new objects": sum(1 for result in results if result[3] > 0),
+                "bytes written": sum(result[3] for result in results)}
+
+def main():
+    parser = argparse.ArgumentParser(description='Store many Boox Notes backups deduplicated by content.')
+    parser.add_argument('--store', dest='store', required=True,
+                        help='Directory of the store')
+    parser.add_argument('--ingest', dest='ingest', nargs='+',
+                        help='Backup directories (or zip/tar archives) to add as snapshots, oldest first')
+    parser.add_argument('--name', dest='name',
+                        help='Snapshot name for a single --ingest (default: name of the backup directory)')
+    parser.add_argument('--jobs', dest='jobs', type=int, default=8,
+                        help='Threads hashing and copying files (default: 8)')
+    args = parser.parse_args()
+
+    store = Store(args.store)
+    if args.ingest is None:
+        for name in store.snapshots():
+            files = store.manifest(name)['files'].values()
+            print(f"{store.snapshot_path(name)}: {len(files)} files, {sum(entry['size'] for entry in files)/1024/1024:.1f} MB")
+        return
+    if args.name is not None and len(args.ingest) > 1:
+        parser.error("--name needs a single --ingest directory")
+    for source in args.ingest:
+        start = time.perf_counter()
+        try:
+            result = store.ingest(source, args.name, args.jobs)
+        except FileExistsError as e:
+            print(f"Skipping {source}: {e}")
+            continue
+        print(f"{result['path']}: {result['files']} files, {result['hashed']} hashed, {result['new objects']} new objects, "
+              f"{result['bytes written']/1024/1024:.1f} MB written in {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
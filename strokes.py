@@ -0,0 +1,186 @@
+import numpy as np
+
+identity = [1, 0, 0, 0, 1, 0, 0, 0, 1]
+
+def shape_matrix(shape):
+    """The 3x3 matrix values of a shape, None if there is none or it is the identity."""
+    matrix = shape['matrix']
+    if matrix == None or matrix['values'] == None or list(matrix['values']) == identity:
+        return None
+    return matrix['values']
+
+def transform_points(x, y, values):
+    """Applies a row major 3x3 matrix (skia.Matrix order) to all points at once."""
+    m = np.asarray(values, dtype=np.float64).reshape(3, 3)
+    tx = m[0, 0] * x + m[0, 1] * y + m[0, 2]
+    ty = m[1, 0] * x + m[1, 1] * y + m[1, 2]
+    if m[2, 0] != 0 or m[2, 1] != 0 or m[2, 2] != 1:
+        w = m[2, 0] * x + m[2, 1] * y + m[2, 2]
+        tx = tx / w
+        ty = ty / w
+    return tx.astype(np.float32), ty.astype(np.float32)
+
+class ShapeRecord:
+    """Metadata of a shape (a NewShapeModel row), supports item access like the shape dicts."""
+
+    __slots__ = ('shapeId', 'documentId', 'pageId', 'boundingRect', 'matrix', 'status')
+
+    def __init__(self, shapeId, documentId, pageId, boundingRect, matrix, status):
+        self.shapeId = shapeId
+        self.documentId = documentId
+        self.pageId = pageId
+        self.boundingRect = boundingRect
+        self.matrix = matrix
+        self.status = status
+
+    @classmethod
+    def from_dict(cls, shape):
+        return cls(shape['shapeId'], shape['documentId'], shape['pageId'], shape['boundingRect'], shape['matrix'], shape['status'])
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+class StrokeStore:
+    """Columnar store of the strokes of a page.
+
+    Points of all strokes are kept in one (n, 2) float32 coordinate buffer
+    (page coordinates, shape matrices applied) and one int32 pressure buffer.
+    Stroke i spans offsets[i]:offsets[i+1], its tight bounds are bounds[i] and
+    its metadata shapes[i].
+    """
+
+    __slots__ = ('coords', 'pressure', 'offsets', 'bounds', 'shapes')
+
+    def __init__(self, coords, pressure, offsets, bounds, shapes):
+        self.coords = coords
+        self.pressure = pressure
+        self.offsets = offsets
+        self.bounds = bounds
+        self.shapes = shapes
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty((0, 2), dtype=np.float32), np.empty(0, dtype=np.int32),
+                   np.zeros(1, dtype=np.int64), np.empty((0, 4), dtype=np.float32), [])
+
+    @classmethod
+    def from_points(cls, points, shapes):
+        """Builds the store from the (x, y, pressure, id) tuples of the point readers.
+
+        Points of shapes that are not in shapes (deleted in the db) are dropped.
+        """
+        points = [p for p in points if p[3] in shapes]
+        if len(points) == 0:
+            return cls.empty()
+        counts = np.array([len(x) for (x, y, pressure, id) in points], dtype=np.int64)
+        offsets = np.zeros(len(points) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        coords = np.empty((int(offsets[-1]), 2), dtype=np.float32)
+        records = []
+        for i, (x, y, pressure, id) in enumerate(points):
+            shape = shapes[id]
+            matrix = shape_matrix(shape)
+            if matrix != None:
+                x, y = transform_points(x, y, matrix)
+            coords[offsets[i]:offsets[i+1], 0] = x
+            coords[offsets[i]:offsets[i+1], 1] = y
+            records.append(shape if isinstance(shape, ShapeRecord) else ShapeRecord.from_dict(shape))
+        pressure = np.concatenate([pressure for (x, y, pressure, id) in points]).astype(np.int32, copy=False)
+        return cls(coords, pressure, offsets, stroke_bounds(coords, offsets), records)
+
+    def __len__(self):
+        return len(self.shapes)
+
+    @property
+    def point_count(self):
+        return int(self.offsets[-1] - self.offsets[0])
+
+    def ids(self):
+        return [shape.shapeId for shape in self.shapes]
+
+    def stroke(self, i):
+        """(x, y, pressure) views of stroke i."""
+        start, end = self.offsets[i], self.offsets[i+1]
+        return self.coords[start:end, 0], self.coords[start:end, 1], self.pressure[start:end]
+
+    def __iter__(self):
+        """Yields (x, y, pressure, shape, bounds) per stroke, the arrays are views into the store."""
+        for i in range(len(self)):
+            x, y, pressure = self.stroke(i)
+            yield x, y, pressure, self.shapes[i], self.bounds[i]
+
+    def __getitem__(self, key):
+        """A slice returns a store sharing the buffers, an index array or mask a compacted copy."""
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                stop = max(start, stop)
+                first, last = self.offsets[start], self.offsets[stop]
+                return StrokeStore(self.coords[first:last], self.pressure[first:last],
+                                   self.offsets[start:stop+1] - first, self.bounds[start:stop], self.shapes[start:stop])
+            key = range(start, stop, step)
+        return self.select(key)
+
+    def simplify(self, tolerance):
+        """A store with every stroke simplified (Ramer-Douglas-Peucker) to the given tolerance in page units."""
+        if tolerance <= 0 or len(self) == 0:
+            return self
+        keep = np.ones(len(self.coords), dtype=bool)
+        counts = np.zeros(len(self), dtype=np.int64)
+        for i in range(len(self)):
+            start, end = self.offsets[i], self.offsets[i+1]
+            keep[start:end] = simplify_points(self.coords[start:end, 0], self.coords[start:end, 1], tolerance)
+            counts[i] = np.count_nonzero(keep[start:end])
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return StrokeStore(self.coords[keep], self.pressure[keep], offsets, self.bounds, self.shapes)
+
+    def select(self, indices):
+        indices = np.arange(len(self))[np.asarray(indices)] if len(indices) > 0 else np.empty(0, dtype=np.int64)
+        counts = self.offsets[indices + 1] - self.offsets[indices]
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        # point indices of all selected strokes
+        points = np.repeat(self.offsets[indices] - offsets[:-1], counts) + np.arange(offsets[-1])
+        return StrokeStore(self.coords[points], self.pressure[points], offsets,
+                           self.bounds[indices], [self.shapes[i] for i in indices])
+
+def simplify_points(x, y, tolerance):
+    """Ramer-Douglas-Peucker simplification of one point run, returns a mask of the points to keep."""
+    count = len(x)
+    keep = np.ones(count, dtype=bool)
+    if count < 3 or tolerance <= 0:
+        return keep
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    keep[1:-1] = False
+    stack = [(0, count - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[start+1:end] - x[start], y[start+1:end] - y[start]
+        length = np.hypot(dx, dy)
+        if length == 0:
+            distance = np.hypot(px, py)
+        else:
+            distance = np.abs(dx * py - dy * px) / length
+        i = int(np.argmax(distance))
+        if distance[i] > tolerance:
+            i = start + 1 + i
+            keep[i] = True
+            stack.append((start, i))
+            stack.append((i, end))
+    return keep
+
+def stroke_bounds(coords, offsets):
+    """Tight (left, top, right, bottom) bounds of every stroke in a CSR point buffer."""
+    bounds = np.zeros((len(offsets) - 1, 4), dtype=np.float32)
+    starts = offsets[:-1]
+    nonempty = offsets[1:] > starts
+    if len(coords) > 0 and nonempty.any():
+        starts = starts[nonempty]
+        bounds[nonempty, 0:2] = np.minimum.reduceat(coords, starts, axis=0)
+        bounds[nonempty, 2:4] = np.maximum.reduceat(coords, starts, axis=0)
+    return bounds
@@ -0,0 +1,134 @@
+import os
+import json
+import math
+import uuid
+import random
+import struct
+import sqlite3
+import argparse
+
+# page size of a Boox Note Air 2
+page_width = 1404
+page_height = 1872
+
+words = ["server", "service", "meeting", "notes", "backup", "python", "design", "review", "todo", "idea",
+         "project", "budget", "draft", "release", "network", "storage", "report", "follow", "update", "question"]
+
+def random_uuid(rnd):
+    return str(uuid.UUID(int=rnd.getrandbits(128), version=4))
+
+def stroke_points(rnd, count):
+    """A smooth random handwriting-like stroke as list of (x, y, pressure)."""
+    x = rnd.uniform(50, page_width - 150)
+    y = rnd.uniform(50, page_height - 50)
+    angle = rnd.uniform(0, 2 * math.pi)
+    points = []
+    for i in range(count):
+        angle += rnd.uniform(-0.4, 0.4)
+        x = min(max(x + math.cos(angle) * 1.5, 0), page_width)
+        y = min(max(y + math.sin(angle) * 1.5, 0), page_height)
+        points.append((x, y, rnd.randint(200, 4095)))
+    return points
+
+def write_point_file(path, notebookId, pageId, strokes):
+    """Writes a point file: 80 byte header, 16 byte point records, 44 byte trailer per shape, trailer offset."""
+    header = struct.pack(">I36s36sf", 1, notebookId.encode('ascii'), pageId.encode('ascii'), 0.0)
+    body = bytearray()
+    trailer = bytearray()
+    for shapeId, points in strokes:
+        start = len(header) + len(body)
+        for (x, y, pressure) in points:
+            body += struct.pack(">fffi", 2.0, x, y, pressure)
+        trailer += struct.pack(">36sii", shapeId.encode('ascii'), start, len(points) * 16)
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(body)
+        f.write(trailer)
+        f.write(struct.pack(">i", len(header) + len(body)))
+
+def create_notebook_db(path):
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE NewShapeModel (id INTEGER PRIMARY KEY, shapeUniqueId TEXT, documentUniqueId TEXT, "
+                "pageUniqueId TEXT, boundingRect TEXT, matrixValues TEXT, status INTEGER, shapeType INTEGER, "
+                "color INTEGER, thickness REAL, createdAt INTEGER)")
+    con.execute("CREATE TABLE HWRDataModel (id INTEGER PRIMARY KEY, documentUniqueId TEXT, pageUniqueId TEXT, "
+                "hwrResult TEXT, candidates TEXT, boundingRect TEXT)")
+    return con
+
+def generate_backup(dir, notebooks=2, pages=5, strokes=200, points=100, files=1, deleted=0.05, seed=1):
+    """Writes a synthetic backup in the layout read_db expects.
+
+    Every page gets strokes shapes of about points points, split over files
+    point files. A fraction deleted of the strokes is only in the point
+    files and missing in NewShapeModel, like erased ink. Some shapes get a
+    non identity matrix, every few strokes form a recognized word.
+    """
+    rnd = random.Random(seed)
+    os.makedirs(dir, exist_ok=True)
+    con = sqlite3.connect(os.path.join(dir, "ShapeDatabase.db"))
+    con.execute("CREATE TABLE NoteModel (id INTEGER PRIMARY KEY, uniqueId TEXT, title TEXT, pageNameList TEXT, notePageInfo TEXT)")
+    for n in range(notebooks):
+        notebookId = random_uuid(rnd)
+        pageIds = [random_uuid(rnd) for i in range(pages)]
+        pageInfo = {"pageInfoMap": {pageId: {"width": page_width, "height": page_height} for pageId in pageIds}}
+        con.execute("INSERT INTO NoteModel (uniqueId, title, pageNameList, notePageInfo) VALUES (?, ?, ?, ?)",
+                    (notebookId, f"Notebook {n + 1}", json.dumps({"pageNameList": pageIds}), json.dumps(pageInfo)))
+        notebook_con = create_notebook_db(os.path.join(dir, f"{notebookId}.db"))
+        for pageId in pageIds:
+            point_dir = os.path.join(dir, "point", notebookId, pageId)
+            os.makedirs(point_dir, exist_ok=True)
+            page_strokes = []
+            for s in range(strokes):
+                shapeId = random_uuid(rnd)
+                page_strokes.append((shapeId, stroke_points(rnd, max(2, int(rnd.gauss(points, points / 4))))))
+            for i, (shapeId, stroke) in enumerate(page_strokes):
+                if rnd.random() < deleted:
+                    continue
+                xs = [x for (x, y, pressure) in stroke]
+                ys = [y for (x, y, pressure) in stroke]
+                matrix = [1, 0, 0, 0, 1, 0, 0, 0, 1]
+                if rnd.random() < 0.1:
+                    matrix = [1, 0, rnd.uniform(-20, 20), 0, 1, rnd.uniform(-20, 20), 0, 0, 1]
+                    xs = [x + matrix[2] for x in xs]
+                    ys = [y + matrix[5] for y in ys]
+                rect = {"left": min(xs), "top": min(ys), "right": max(xs), "bottom": max(ys)}
+                notebook_con.execute("INSERT INTO NewShapeModel (shapeUniqueId, documentUniqueId, pageUniqueId, boundingRect, "
+                                     "matrixValues, status, shapeType, color, thickness, createdAt) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                     (shapeId, notebookId, pageId, json.dumps(rect), json.dumps({"values": matrix}),
+                                      0, 2, -16777216, 2.0, 1700000000000 + i))
+                if i % 5 == 0:
+                    word = rnd.choice(words)
+                    candidates = [word, word.capitalize(), rnd.choice(words)]
+                    notebook_con.execute("INSERT INTO HWRDataModel (documentUniqueId, pageUniqueId, hwrResult, candidates, boundingRect) "
+                                         "VALUES (?, ?, ?, ?, ?)", (notebookId, pageId, word, json.dumps(candidates), json.dumps(rect)))
+            per_file = math.ceil(len(page_strokes) / files)
+            for f in range(files):
+                chunk = page_strokes[f * per_file:(f + 1) * per_file]
+                if len(chunk) > 0:
+                    write_point_file(os.path.join(point_dir, random_uuid(rnd)), notebookId, pageId, chunk)
+        notebook_con.commit()
+        notebook_con.close()
+    con.commit()
+    con.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic Boox Notes backup for testing and benchmarks.')
+    parser.add_argument('--directory', dest='dir', required=True,
+                        help='Directory the backup is written to')
+    parser.add_argument('--notebooks', dest='notebooks', type=int, default=2,
+                        help='Number of notebooks (default: 2)')
+    parser.add_argument('--pages', dest='pages', type=int, default=5,
+                        help='Pages per notebook (default: 5)')
+    parser.add_argument('--strokes', dest='strokes', type=int, default=200,
+                        help='Strokes per page (default: 200)')
+    parser.add_argument('--points', dest='points', type=int, default=100,
+                        help='Average points per stroke (default: 100)')
+    parser.add_argument('--files', dest='files', type=int, default=1,
+                        help='Point files per page (default: 1)')
+    parser.add_argument('--seed', dest='seed', type=int, default=1,
+                        help='Random seed (default: 1)')
+    args = parser.parse_args()
+    generate_backup(args.dir, args.notebooks, args.pages, args.strokes, args.points, args.files, seed=args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import os
+import math
+import shutil
+from collections import OrderedDict
+import skia
+from decode import load_strokes
+from render import draw_strokes, stroke_width
+from spatial import GridIndex
+
+class TileCache:
+    """In-memory LRU of rendered tiles, can be shared by several TileRenderers."""
+
+    def __init__(self, max_tiles=256):
+        self.max_tiles = max_tiles
+        self.tiles = OrderedDict()
+
+    def get(self, key):
+        image = self.tiles.get(key)
+        if image is not None:
+            self.tiles.move_to_end(key)
+        return image
+
+    def put(self, key, image):
+        self.tiles[key] = image
+        self.tiles.move_to_end(key)
+        while len(self.tiles) > self.max_tiles:
+            self.tiles.popitem(last=False)
+
+class TileRenderer:
+    """Renders a page as pyramid of fixed size tiles.
+
+    Level 0 is the native page size, every further level halves the zoom
+    until the whole page fits into one tile. Strokes are decoded once,
+    tiles only draw the strokes intersecting them. Rendered tiles are kept
+    in a TileCache and, if store_dir is given, as png files in
+    <store_dir>/<key>/<fingerprint>/<level>/<x>_<y>.png. The fingerprint
+    (see export.page_fingerprint) changes with the shapes and point files of
+    the page, tiles of older versions of the page are removed.
+    """
+
+    def __init__(self, files, info, shapes, key, tile_size=256, tile_cache=None, store_dir=None, cache=None):
+        self.files = files
+        self.info = info
+        self.width = info['width']
+        self.height = info['height']
+        self.shapes = shapes
+        self.key = key
+        self.tile_size = tile_size
+        self.tile_cache = tile_cache if tile_cache is not None else TileCache()
+        self.store_dir = store_dir
+        self.cache = cache
+        self.strokes = None
+        self.grid = None
+        self.fingerprint = None
+        self.levels = max(0, math.ceil(math.log2(max(self.width, self.height) / tile_size))) + 1
+
+    def zoom(self, level):
+        return 2.0 ** -level
+
+    def tile_count(self, level):
+        """Number of tiles (columns, rows) of a level."""
+        span = self.tile_size / self.zoom(level)
+        return math.ceil(self.width / span), math.ceil(self.height / span)
+
+    def load(self):
+        if self.strokes is None:
+            self.strokes = load_strokes(self.files, self.shapes, False, self.cache)
+            self.grid = GridIndex(self.strokes.bounds, self.tile_size)
+
+    def version_dir(self):
+        """Store directory of the current version of the page, older versions are removed on first use."""
+        if self.fingerprint is None:
+            from export import page_fingerprint
+            task = (self.files, self.info, self.shapes, None, f"tiles-{self.tile_size}", 0, None)
+            self.fingerprint = page_fingerprint(task)
+            page_dir = os.path.join(self.store_dir, str(self.key))
+            if os.path.isdir(page_dir):
+                for entry in os.scandir(page_dir):
+                    if entry.name == self.fingerprint:
+                        continue
+                    if entry.is_dir():
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                    else:
+                        os.remove(entry.path)
+        return os.path.join(self.store_dir, str(self.key), self.fingerprint)
+
+    def tile_path(self, level, x, y):
+        return os.path.join(self.version_dir(), str(level), f"{x}_{y}.png")
+
+    def tile(self, level, x, y):
+        """The tile image at column x, row y of a level."""
+        key = (self.key, level, x, y)
+        image = self.tile_cache.get(key)
+        if image is not None:
+            return image
+        path = self.tile_path(level, x, y) if self.store_dir is not None else None
+        if path is not None and os.path.exists(path):
+            image = skia.Image.open(path)
+        else:
+            image = self.render_tile(level, x, y)
+            if path is not None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                image.save(path, skia.kPNG)
+        self.tile_cache.put(key, image)
+        return image
+
+    def render_tile(self, level, x, y):
+        self.load()
+        zoom = self.zoom(level)
+        span = self.tile_size / zoom
+        left, top = x * span, y * span
+        surface = skia.Surface(self.tile_size, self.tile_size)
+        canvas = surface.getCanvas()
+        canvas.scale(zoom, zoom)
+        canvas.translate(-left, -top)
+        margin = stroke_width
+        indices = self.grid.query(left - margin, top - margin, left + span + margin, top + span + margin)
+        if len(indices) > 0:
+            draw_strokes(canvas, self.strokes.select(indices))
+        return surface.makeImageSnapshot()
+
+    def render_level(self, level):
+        """Stitches all tiles of a level into one image of the page size at that level."""
+        zoom = self.zoom(level)
+        surface = skia.Surface(max(1, math.ceil(self.width * zoom)), max(1, math.ceil(self.height * zoom)))
+        canvas = surface.getCanvas()
+        columns, rows = self.tile_count(level)
+        for y in range(rows):
+            for x in range(columns):
+                canvas.drawImage(self.tile(level, x, y), x * self.tile_size, y * self.tile_size)
+        return surface.makeImageSnapshot()
+
+    def thumbnail(self, max_size):
+        """Page image fitting into max_size x max_size, stitched from the coarsest sufficient level."""
+        scale = min(1.0, max_size / max(self.width, self.height))
+        level = min(self.levels - 1, max(0, math.floor(-math.log2(scale))))
+        image = self.render_level(level)
+        width = max(1, round(self.width * scale))
+        height = max(1, round(self.height * scale))
+        if (image.width(), image.height()) == (width, height):
+            return image
+        return image.resize(width, height, skia.SamplingOptions(skia.FilterMode.kLinear, skia.MipmapMode.kLinear))
+
+    def write_pyramid(self):
+        """Renders all tiles of all levels into the store directory."""
+        for level in range(self.levels):
+            columns, rows = self.tile_count(level)
+            for y in range(rows):
+                for x in range(columns):
+                    self.tile(level, x, y)
+
+def page_tiles(notebooks, name, pageNr, tile_size=256, tile_cache=None, store_dir=None, cache=None):
+    """TileRenderer of a notebook page, None if the page has no point files."""
+    for notebook in notebooks['notebooks']:
+        if notebook['name'] != name:
+            continue
+        for page in notebook['pages']:
+            if page['pageNr'] == pageNr and len(page['points']) > 0:
+                point_dir = os.path.join(notebooks['basedir'], "point", notebook['id'], page['id'])
+                files = [os.path.join(point_dir, point) for point in page['points']]
+                return TileRenderer(files, page['info'], page['shapes'], page['id'], tile_size, tile_cache, store_dir, cache)
+    return None
@@ -0,0 +1,49 @@
+import numpy as np
+import skia
+from render import draw_strokes, stroke_paint_key
+
+def svg_color(color):
+    return f"#{skia.ColorGetR(color):02x}{skia.ColorGetG(color):02x}{skia.ColorGetB(color):02x}"
+
+def svg_path_data(x, y, precision=1):
+    """SVG path data (M x y L x y ...) of one point run."""
+    coords = np.round(np.column_stack((x, y)), precision).tolist()
+    points = [f"{px:g} {py:g}" for (px, py) in coords]
+    return "M" + points[0] + ("L" + " ".join(points[1:]) if len(points) > 1 else "")
+
+def write_svg(output, store, info, precision=1):
+    """Writes the strokes of a page as SVG, one path element per stroke, streamed to the file."""
+    with open(output, 'w', encoding='utf-8') as f:
+        f.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{info["width"]}" height="{info["height"]}" '
+                f'viewBox="0 0 {info["width"]} {info["height"]}">\n')
+        f.write('<g fill="none">\n')
+        for (x, y, pressure, shape, bounds) in store:
+            if len(x) == 0:
+                continue
+            color, width = stroke_paint_key(shape)
+            f.write(f'<path stroke="{svg_color(color)}" stroke-width="{width}" d="{svg_path_data(x, y, precision)}"/>\n')
+        f.write('</g>\n</svg>\n')
+
+class PdfWriter:
+    """Multi-page PDF document, every page is written to the file when it is added."""
+
+    def __init__(self, output):
+        self.stream = skia.FILEWStream(output)
+        self.document = skia.PDF.MakeDocument(self.stream)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_page(self, store, info):
+        canvas = self.document.beginPage(info['width'], info['height'])
+        draw_strokes(canvas, store)
+        self.document.endPage()
+
+    def close(self):
+        if self.document is not None:
+            self.document.close()
+            self.stream.flush()
+            self.document = None
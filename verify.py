@@ -0,0 +1,89 @@
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+import archive
+from decode import Catalog, get_file_info, PointFileError
+
+def scan_file(file):
+    """Reads footer and trailer of a point file, returns {file, shapes: {id: point count}, error}."""
+    result = {"file": file, "shapes": {}, "error": None}
+    try:
+        for shape in get_file_info(file, False):
+            id = shape['id'].decode('UTF-8')
+            if id in result['shapes']:
+                raise PointFileError(f"shape {id} is in the trailer twice")
+            result['shapes'][id] = shape['count']
+    except (PointFileError, UnicodeDecodeError, OSError) as e:
+        result['error'] = str(e) if not isinstance(e, UnicodeDecodeError) else "shape id is no valid UTF-8"
+    return result
+
+def point_files(basedir):
+    """Yields (notebook id, page id, file) of every file in the point directory."""
+    point_dir = os.path.join(basedir, "point")
+    if not archive.isdir(point_dir):
+        return
+    for notebookId in archive.listdir(point_dir):
+        if not archive.isdir(os.path.join(point_dir, notebookId)):
+            continue
+        for pageId in archive.listdir(os.path.join(point_dir, notebookId)):
+            page_dir = os.path.join(point_dir, notebookId, pageId)
+            if archive.isdir(page_dir):
+                for point in archive.listdir(page_dir):
+                    yield notebookId, pageId, os.path.join(page_dir, point)
+
+def verify_backup(dir, jobs=8):
+    """Checks all point files against the databases without reading any point data.
+
+    Only footer and trailer of the point files are read (on jobs threads)
+    and compared with the shape ids rendering draws (NotebookDB.shape_ids,
+    rows without matrix or bounding rect are left out). Returns a report with
+    the point files that are inconsistent (unreadable trailer), orphaned
+    (unknown notebook or page, or none of their shapes in the database) and
+    the pages whose database shapes are missing in the point files.
+    Notebooks whose database can not be read are listed in missing with the
+    error, their point files are only checked for consistency.
+    """
+    unreadable = []
+    with Catalog(dir) as catalog:
+        pages = {}
+        for notebook in catalog.notebooks:
+            try:
+                rows = catalog.db(notebook.id).shape_ids()
+            except (sqlite3.Error, OSError) as e:
+                unreadable.append({"notebook": notebook.name, "notebookId": notebook.id, "error": f"database not readable: {e}"})
+                rows = None
+            for page in notebook.pages:
+                pages[(notebook.id, page.id)] = (notebook, page, rows.get(page.id, set()) if rows is not None else None)
+    files = list(point_files(dir))
+    with ThreadPoolExecutor(jobs) as pool:
+        results = list(pool.map(scan_file, [file for (notebookId, pageId, file) in files]))
+
+    report = {"files": len(files), "shapes": 0, "points": 0, "erased": 0, "inconsistent": [], "orphaned": [], "missing": []}
+    found = {}
+    for (notebookId, pageId, file), result in zip(files, results):
+        if result['error'] is not None:
+            report['inconsistent'].append({"file": file, "error": result['error']})
+            continue
+        report['shapes'] += len(result['shapes'])
+        report['points'] += sum(result['shapes'].values())
+        if (notebookId, pageId) not in pages:
+            known = any(key[0] == notebookId for key in pages)
+            report['orphaned'].append({"file": file, "reason": "unknown page" if known else "unknown notebook"})
+            continue
+        ids = pages[(notebookId, pageId)][2]
+        if ids is None:
+            continue
+        found.setdefault((notebookId, pageId), set()).update(result['shapes'])
+        erased = sum(1 for id in result['shapes'] if id not in ids)
+        report['erased'] += erased
+        if erased == len(result['shapes']) and erased > 0:
+            report['orphaned'].append({"file": file, "reason": "no shape in NewShapeModel"})
+    report['missing'].extend(unreadable)
+    for key, (notebook, page, ids) in pages.items():
+        if ids is None:
+            continue
+        missing = ids - found.get(key, set())
+        if len(missing) > 0:
+            report['missing'].append({"notebook": notebook.name, "notebookId": notebook.id, "pageNr": page.pageNr,
+                                      "pageId": page.id, "shapes": sorted(missing)})
+    return report